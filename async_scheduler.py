@@ -0,0 +1,434 @@
+import asyncio
+import re
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from multidict import CIMultiDict
+
+from http_client import RequestGovernor
+from main import FuzzingPipelineScheduler, ProjectInfo, parse_gitlab_datetime
+from runners import RunnerCapacityModel, count_fuzz_jobs, runner_capacity_from_api
+
+LINK_NEXT_RE = re.compile(r'<([^>]+)>\s*;\s*rel="next"')
+
+
+class AsyncHttpError(Exception):
+    def __init__(self, status: int, url: str, text: str = ""):
+        super().__init__(f"HTTP {status} for {url}: {text[:200]}")
+        self.status = status
+        self.url = url
+
+
+class AsyncHttpClient:
+    """
+    Асинхронный HTTP клиент с общим пулом соединений.
+    Ограничивает число одновременных запросов, сами запросы выполняются как корутины одного event loop.
+    Запросы к governed_hosts дополнительно проходят через RequestGovernor.
+    """
+
+    def __init__(self, max_concurrency: int = 64, limit_per_host: int = 32, timeout: float = 30,
+                 governor: Optional[RequestGovernor] = None, governed_hosts: Optional[Set[str]] = None):
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.governor = governor
+        self.governed_hosts = governed_hosts or set()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncHttpClient":
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=self.limit_per_host)
+        self._session = aiohttp.ClientSession(connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, method: str, url: str, headers: Optional[Dict] = None,
+                      params: Optional[Dict] = None, json: Any = None) -> Tuple[Any, Mapping[str, str]]:
+        """
+        Выполнение запроса. Возвращает декодированный JSON и заголовки ответа — копию без учета регистра
+        имен, так как прокси и серверы на Rack 3 передают заголовки в нижнем регистре
+        """
+        governor = self.governor if urlsplit(url).hostname in self.governed_hosts else None
+        if governor is not None:
+            while True:
+                delay = governor.try_acquire()
+                if delay == 0:
+                    break
+                await asyncio.sleep(delay)
+
+        status, response_headers = None, None
+        try:
+            async with self._semaphore:
+                async with self._session.request(method, url, headers=headers, params=params, json=json) as response:
+                    status, response_headers = response.status, response.headers
+                    if response.status >= 400:
+                        raise AsyncHttpError(response.status, url, await response.text())
+                    if response.status == 204 or method == "HEAD":
+                        return None, CIMultiDict(response.headers)
+                    return await response.json(content_type=None), CIMultiDict(response.headers)
+        finally:
+            if governor is not None:
+                governor.release(status, response_headers)
+
+    async def get(self, url: str, headers: Optional[Dict] = None,
+                  params: Optional[Dict] = None) -> Tuple[Any, Mapping[str, str]]:
+        return await self.request("GET", url, headers=headers, params=params)
+
+    async def exists(self, url: str, headers: Optional[Dict] = None, params: Optional[Dict] = None,
+                     method: str = "GET") -> bool:
+        """Проверка существования ресурса: 404 — ресурса нет, остальные ошибки пробрасываются"""
+        try:
+            await self.request(method, url, headers=headers, params=params)
+            return True
+        except AsyncHttpError as e:
+            if e.status == 404:
+                return False
+            raise
+
+    async def iter_keyset_pages(self, url: str, headers: Optional[Dict] = None,
+                                params: Optional[Dict] = None) -> AsyncIterator[List[Dict]]:
+        """
+        Постраничный обход списка GitLab API с keyset пагинацией: следующая страница запрашивается
+        по ссылке rel="next" заголовка Link, на последней странице ее нет
+        """
+        data, response_headers = await self.get(url, headers=headers, params=params)
+        while True:
+            yield data
+            match = LINK_NEXT_RE.search(response_headers.get('Link') or "")
+            if not data or match is None:
+                return
+            # Ссылка уже содержит все параметры запроса и курсор
+            data, response_headers = await self.get(match.group(1), headers=headers)
+
+
+class AsyncFuzzingPipelineScheduler(FuzzingPipelineScheduler):
+    """
+    Планировщик, в котором сбор проектов, опрос раннеров, запросы в DefectDojo и запуск пайплайнов
+    выполняются корутинами в одном event loop.
+    """
+
+    def __init__(self, gitlab_url: str, private_token: str, group_id: int, max_concurrency: int = 64,
+                 defectdojo_url: Optional[str] = None, defectdojo_token: Optional[str] = None):
+        """
+        :param max_concurrency: Максимальное число одновременных HTTP запросов
+        """
+        super().__init__(gitlab_url, private_token, group_id,
+                         defectdojo_url=defectdojo_url, defectdojo_token=defectdojo_token)
+        self.max_concurrency = max_concurrency
+        self.client: Optional[AsyncHttpClient] = None
+
+    def api_url(self, path: str) -> str:
+        return f"{self.gitlab_url}/api/v4{path}"
+
+    async def get_available_runners_async(self) -> List[Dict]:
+        """Асинхронный аналог get_available_runners: раннеры всех уровней без повторов"""
+        results = await asyncio.gather(
+            self.list_runners_async(f"/groups/{self.group_id}/runners", 'instance_type'),
+            self.list_runners_async(f"/groups/{self.group_id}/runners", 'group_type'),
+            self.list_runners_async("/runners", 'project_type'),
+        )
+        available_runners: Dict[int, Dict] = {}
+        for runners in results:
+            for runner in runners:
+                available_runners.setdefault(runner['id'], runner)
+        return list(available_runners.values())
+
+    async def list_runners_async(self, path: str, runner_type: str) -> List[Dict]:
+        """Асинхронный аналог list_runners: страницы после первой запрашиваются одновременно"""
+        url = self.api_url(path)
+        params = {'type': runner_type, 'status': 'online', 'paused': 'false', 'per_page': 100}
+
+        available_runners, headers = await self.client.get(url, headers=self.headers, params={**params, 'page': 1})
+        total_pages = headers.get('X-Total-Pages')
+        if total_pages:
+            pages = await asyncio.gather(*(self.client.get(url, headers=self.headers, params={**params, 'page': page})
+                                           for page in range(2, int(total_pages) + 1)))
+            for data, _ in pages:
+                available_runners.extend(data)
+            return available_runners
+
+        next_page = headers.get('X-Next-Page')
+        while next_page:
+            data, headers = await self.client.get(url, headers=self.headers, params={**params, 'page': next_page})
+            available_runners.extend(data)
+            next_page = headers.get('X-Next-Page')
+        return available_runners
+
+    async def get_runner_capacity_async(self, available_runners: List[Dict]) -> RunnerCapacityModel:
+        """Асинхронный аналог get_runner_capacity"""
+        async def fetch(runner: Dict):
+            base = self.api_url(f"/runners/{runner['id']}")
+            (details, _), (jobs, jobs_headers) = await asyncio.gather(
+                self.client.get(base, headers=self.headers),
+                self.client.get(f"{base}/jobs", headers=self.headers, params={'status': 'running', 'per_page': 100}),
+            )
+            running_jobs = int(jobs_headers.get('X-Total') or len(jobs))
+            return runner_capacity_from_api(details, running_jobs,
+                                            self.runner_concurrency.get(runner['id'], self.default_runner_concurrency),
+                                            count_fuzz_jobs(jobs))
+
+        return RunnerCapacityModel(list(await asyncio.gather(*(fetch(r) for r in available_runners))))
+
+    async def get_fuzzing_projects_async(self) -> List[ProjectInfo]:
+        """
+        Асинхронный аналог get_fuzzing_projects. Заданные discovery_backend или project_cache работают
+        через синхронный get_fuzzing_projects (со своим листингом и хранилищем) в отдельном потоке
+        """
+        if self.discovery_backend is not None or self.project_cache is not None:
+            return await asyncio.to_thread(self.get_fuzzing_projects)
+
+        # Тот же листинг, что и в iter_project_stubs: keyset пагинация по id, упрощенное представление,
+        # архивные проекты отбираются на стороне GitLab
+        params = {'include_subgroups': 'true', 'simple': 'true', 'archived': 'false', 'pagination': 'keyset',
+                  'order_by': 'id', 'sort': 'asc', 'per_page': 100}
+        tasks = []
+        try:
+            async for page in self.client.iter_keyset_pages(self.api_url(f"/groups/{self.group_id}/projects"),
+                                                            headers=self.headers, params=params):
+                # Проекты страницы обогащаются, пока запрашивается следующая страница
+                tasks.extend(asyncio.ensure_future(self.enrich_project_async(p)) for p in page)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        enriched = await asyncio.gather(*tasks)
+        return [p for p in enriched if p is not None]
+
+    async def enrich_project_async(self, project: Dict) -> Optional[ProjectInfo]:
+        """Асинхронный аналог enrich_project. Проект пропускается при ошибке GitLab API"""
+        base = self.api_url(f"/projects/{project['id']}")
+        has_gitlab_ci_file = False
+        ci_blob_id = None
+        last_modified = None
+        last_pipeline_run = None
+        pipeline_run_count = 0
+
+        try:
+            # Ответ о ветке содержит и последний коммит в main
+            branch = await self.main_branch_async(base)
+            main_branch_exists = branch is not None
+
+            if main_branch_exists:
+                commit = branch.get('commit') or {}
+                last_modified = parse_gitlab_datetime(commit.get('committed_date'))
+                (has_gitlab_ci_file, ci_blob_id), pipelines = await asyncio.gather(
+                    self.ci_file_async(project['id'], base, commit.get('id')),
+                    self.client.get(f"{base}/pipelines", headers=self.headers,
+                                    params={'ref': 'main', 'order_by': 'id', 'sort': 'desc',
+                                            'per_page': self.pipeline_summary.page_size}),
+                )
+
+                pipelines_data, pipelines_headers = pipelines
+                page = [(p['id'], p['updated_at']) for p in pipelines_data]
+                total = pipelines_headers.get('X-Total')
+                if await asyncio.to_thread(self.pipeline_summary.needs_seed, project['id'], page, total):
+                    total = await self.count_pipelines_async(f"{base}/pipelines")
+                summary = self.pipeline_summary.update(project['id'], page, total)
+                last_pipeline_run = summary.last_pipeline_run
+                pipeline_run_count = summary.pipeline_run_count
+
+        except (AsyncHttpError, aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+        return ProjectInfo(
+            id=project['id'],
+            name=project['name'],
+            path_with_namespace=project['path_with_namespace'],
+            web_url=project['web_url'],
+            main_branch_exists=main_branch_exists,
+            has_gitlab_ci_file=has_gitlab_ci_file,
+            last_modified=last_modified,
+            last_pipeline_run=last_pipeline_run,
+            pipeline_run_count=pipeline_run_count,
+            default_branch=project.get('default_branch') or "main",
+            archived=project.get('archived', False),
+            ci_blob_id=ci_blob_id
+        )
+
+    async def count_pipelines_async(self, url: str) -> int:
+        """Асинхронный аналог PipelineSummaryTracker.count_pages"""
+        search = self.pipeline_summary.page_search()
+        page = next(search)
+        try:
+            while True:
+                data, _ = await self.client.get(url, headers=self.headers, params={
+                    'ref': 'main', 'per_page': self.pipeline_summary.page_size, 'page': page})
+                page = search.send(len(data))
+        except StopIteration as result:
+            return result.value
+
+    async def main_branch_async(self, base: str) -> Optional[Dict]:
+        """Ветка main проекта или None, если ее нет"""
+        try:
+            branch, _ = await self.client.get(f"{base}/repository/branches/main", headers=self.headers)
+            return branch
+        except AsyncHttpError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    async def ci_file_async(self, project_id: int, base: str,
+                            head_sha: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """
+        Асинхронный аналог CiFileProbe.has_ci_file с тем же кэшем по SHA головного коммита main:
+        HEAD запрос выполняется только после изменения ветки. Возвращает наличие файла и его blob id
+        """
+        cached = self.ci_file_probe.cached(project_id, head_sha)
+        if cached is not None:
+            return cached
+        headers = await self.ci_file_headers_async(base, head_sha or "main")
+        exists, blob_id = headers is not None, headers.get('X-Gitlab-Blob-Id') if headers else None
+        if head_sha:
+            self.ci_file_probe.remember(project_id, head_sha, exists, blob_id)
+        return exists, blob_id
+
+    async def ci_file_headers_async(self, base: str, ref: str = "main") -> Optional[Mapping[str, str]]:
+        """Заголовки HEAD запроса к .gitlab-ci.yml на ref или None, если файла нет"""
+        try:
+            _, headers = await self.client.request("HEAD", f"{base}/repository/files/.gitlab-ci.yml",
+                                                   headers=self.headers, params={'ref': ref})
+            return headers
+        except AsyncHttpError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    async def get_defect_factor_async(self, project: ProjectInfo) -> float:
+        """Асинхронный аналог get_defect_factor"""
+        if not self.defectdojo_url or not self.defectdojo_token:
+            return 0
+        if self.defect_store is not None:
+            return await asyncio.to_thread(self.get_defect_factor, project)
+
+        headers = {
+            'Authorization': f'Token {self.defectdojo_token}',
+            'Content-Type': 'application/json',
+        }
+        try:
+            if self.product_index is not None:
+                # Индекс обновляется синхронно не чаще refresh_interval, поиск по нему без запросов
+                product_id = await asyncio.to_thread(self.product_index.product_id, project)
+            else:
+                products, _ = await self.client.get(f"{self.defectdojo_url}/api/v2/products/",
+                                                    headers=headers, params={'name': project.name})
+                results = products.get('results', [])
+                product_id = results[0]['id'] if results else None
+            if product_id is None:
+                return 0
+            if self.defect_memo is not None:
+                cached = self.defect_memo.lookup(product_id)
+                if cached is not None:
+                    return cached
+
+            findings, _ = await self.client.get(f"{self.defectdojo_url}/api/v2/findings/", headers=headers, params={
+                'product': product_id,
+                'active': 'true',
+                'verified': 'true',
+                'false_p': 'false',
+                'duplicate': 'false',
+                'limit': 1,
+            })
+            count = findings.get('count', 0)
+            if self.defect_memo is not None:
+                self.defect_memo.store(product_id, count)
+            return count
+
+        except (AsyncHttpError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"[WARN] Не удалось получить данные из DefectDojo для проекта {project.name}: {e}")
+            return 0
+
+    async def prioritize_projects_async(self, projects: List[ProjectInfo],
+                                        capacity: Optional[RunnerCapacityModel] = None) -> List[ProjectInfo]:
+        candidates = self.filter_candidates(projects)
+        if capacity is not None:
+            # Конфигурация CI загружается синхронным клиентом, поэтому вне event loop
+            tags = await asyncio.gather(*(asyncio.to_thread(self.job_tags.job_tag_sets, p) for p in candidates))
+            candidates = [p for p, t in zip(candidates, tags) if capacity.can_reserve_all(t, p.id)]
+        defect_counts = await asyncio.gather(*(self.get_defect_factor_async(p) for p in candidates))
+        return self.rank_projects(candidates, list(defect_counts))
+
+    async def run_pipelines_async(self, projects: List[ProjectInfo],
+                                  capacity: RunnerCapacityModel) -> List[ProjectInfo]:
+        """
+        Запуск пайплайнов на ветке main для наиболее приоритетных проектов по числу свободных слотов:
+        для каждой задачи фаззинга пайплайна занимается свой слот
+        """
+        selected = []
+        for project in projects:
+            if capacity.total_free_slots() == 0:
+                break
+            tags = await asyncio.to_thread(self.job_tags.job_tag_sets, project)
+            if capacity.reserve_all(tags, project.id) is not None:
+                selected.append(project)
+        results = await asyncio.gather(
+            *(self.client.request("POST", self.api_url(f"/projects/{p.id}/pipeline"),
+                                  headers=self.headers, params={'ref': 'main'}) for p in selected),
+            return_exceptions=True
+        )
+
+        started = []
+        for p, result in zip(selected, results):
+            if isinstance(result, Exception):
+                print(f"[WARN] Не удалось запустить пайплайн для проекта {p.path_with_namespace}: {result}")
+                continue
+            started.append(p)
+            self.record_pipeline_started(p.id, result[0]['id'])
+        return started
+
+    async def schedule_pipelines_async(self) -> None:
+        print("Планирование запусков пайплайнов...")
+        self.dispatch_plan = []
+
+        async with AsyncHttpClient(max_concurrency=self.max_concurrency, governor=self.governor,
+                                   governed_hosts={urlsplit(self.gitlab_url).hostname}) as client:
+            self.client = client
+            try:
+                if self.defect_store is not None:
+                    self.defect_store.start_sync()
+                if self.defect_memo is not None:
+                    await asyncio.to_thread(self.defect_memo.check_imports)
+                # Раннеры и проекты запрашиваются одновременно
+                available_runners, projects = await asyncio.gather(
+                    self.get_available_runners_async(),
+                    self.get_fuzzing_projects_async(),
+                )
+                if not available_runners:
+                    print("Нет доступных раннеров. Пропуск цикла планирования.")
+                    return
+
+                capacity = await self.get_runner_capacity_async(available_runners)
+                free_slots = capacity.total_free_slots()
+                if free_slots == 0:
+                    print("Нет свободных слотов у раннеров. Пропуск цикла планирования.")
+                    self.record_utilization(free_slots, capacity, None)
+                    return
+
+                if not projects:
+                    print("Нет доступных проектов в группе.")
+                    return
+
+                prioritized_projects = await self.prioritize_projects_async(projects, capacity)
+                if not prioritized_projects:
+                    print("Нет проектов, удовлетворяющих условиям для запуска.")
+                    self.record_utilization(free_slots, capacity, [])
+                    return
+
+                started = await self.run_pipelines_async(prioritized_projects, capacity)
+                print(f"Планирование завершено, запущено пайплайнов: {len(started)}")
+
+                started_ids = {p.id for p in started}
+                self.record_utilization(free_slots, capacity,
+                                        [p for p in prioritized_projects if p.id not in started_ids])
+            finally:
+                self.client = None
+
+    def schedule_pipelines(self) -> None:
+        """Синхронная обёртка для запуска из cron и существующих точек входа"""
+        asyncio.run(self.schedule_pipelines_async())
@@ -0,0 +1,91 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class RunnerUtilizationStore:
+    """
+    Временной ряд загрузки раннеров в SQLite: одна строка на цикл планирования.
+    pending_jobs — проекты, готовые к запуску, но не запущенные из-за нехватки слотов
+    """
+
+    def __init__(self, path: str = "scheduler_cache.sqlite3", retention: timedelta = timedelta(weeks=8)):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        self.retention = retention
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runner_utilization ("
+                " ts INTEGER PRIMARY KEY,"
+                " free_slots INTEGER NOT NULL,"
+                " running_fuzz_jobs INTEGER NOT NULL,"
+                " pending_jobs INTEGER)"
+            )
+
+    def record(self, free_slots: int, running_fuzz_jobs: int, pending_jobs: Optional[int],
+               ts: Optional[float] = None) -> None:
+        ts = int(ts if ts is not None else time.time())
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO runner_utilization VALUES (?, ?, ?, ?)",
+                               (ts, free_slots, running_fuzz_jobs, pending_jobs))
+            self._conn.execute("DELETE FROM runner_utilization WHERE ts < ?",
+                               (ts - int(self.retention.total_seconds()),))
+
+    def samples(self, since: Optional[float] = None) -> List[Tuple[int, int, int, Optional[int]]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT ts, free_slots, running_fuzz_jobs, pending_jobs FROM runner_utilization"
+                " WHERE ts >= ? ORDER BY ts", (int(since or 0),)
+            ).fetchall()
+
+    def forecast(self, horizon: int, cycle_interval: timedelta,
+                 now: Optional[datetime] = None, recent_weight: float = 0.3) -> List[Tuple[datetime, float]]:
+        """
+        Прогноз свободных слотов на horizon следующих циклов.
+        Основа — среднее по тому же часу недели в истории (ночи и выходные повторяются),
+        смешанное с последним наблюдением с весом recent_weight, затухающим с удалением от текущего момента.
+        """
+        now = now or datetime.now(timezone.utc)
+        history = self.samples()
+        if not history:
+            return []
+
+        buckets: Dict[int, List[int]] = {}
+        for ts, free_slots, _, _ in history:
+            buckets.setdefault(_hour_of_week(datetime.fromtimestamp(ts, timezone.utc)), []).append(free_slots)
+        overall = sum(s[1] for s in history) / len(history)
+        latest = history[-1][1]
+
+        result = []
+        for step in range(1, horizon + 1):
+            at = now + cycle_interval * step
+            bucket = buckets.get(_hour_of_week(at))
+            seasonal = sum(bucket) / len(bucket) if bucket else overall
+            weight = recent_weight / step
+            result.append((at, weight * latest + (1 - weight) * seasonal))
+        return result
+
+
+def _hour_of_week(moment: datetime) -> int:
+    moment = moment.astimezone(timezone.utc)
+    return moment.weekday() * 24 + moment.hour
+
+
+def plan_dispatches(backlog: Sequence, forecast: List[Tuple[datetime, float]]) -> List[Tuple[datetime, list]]:
+    """
+    Распределение отложенных проектов (в порядке приоритета) по прогнозным окнам свободной емкости
+    :return: Окна с проектами, которые ожидается запустить в каждом из них
+    """
+    plan = []
+    remaining = list(backlog)
+    for at, free_slots in forecast:
+        if not remaining:
+            break
+        slots = int(free_slots)
+        if slots <= 0:
+            continue
+        plan.append((at, remaining[:slots]))
+        remaining = remaining[slots:]
+    return plan
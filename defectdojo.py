@@ -0,0 +1,650 @@
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from threading import Event, Lock, Thread
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+
+from main import ProjectInfo
+
+
+def defectdojo_headers(token: str) -> Dict[str, str]:
+    return {
+        'Authorization': f'Token {token}',
+        'Content-Type': 'application/json',
+    }
+
+
+def iter_defectdojo_pages(session, url: str, headers: Dict[str, str], params: Dict,
+                          timeout: float = 30) -> Iterator[Dict]:
+    """Обход списка DefectDojo API v2 по ссылкам next (limit/offset)"""
+    response = session.get(url, headers=headers, params=params, timeout=timeout)
+    while True:
+        response.raise_for_status()
+        data = response.json()
+        yield from data.get('results', [])
+        if not data.get('next'):
+            return
+        # Ссылка next уже содержит все параметры запроса
+        response = session.get(data['next'], headers=headers, timeout=timeout)
+
+
+class DefectDojoProductIndex:
+    """
+    Индекс продуктов DefectDojo: имя продукта и ID проекта GitLab -> ID продукта.
+    Индекс хранится в SQLite и обновляется инкрементально: продукты читаются в порядке убывания
+    updated до первого уже известного изменения. Полное перечитывание раз в full_refresh_interval
+    удаляет из индекса удаленные продукты.
+    """
+
+    def __init__(self, session, defectdojo_url: str, token: str, path: str = "scheduler_cache.sqlite3",
+                 refresh_interval: float = 900, full_refresh_interval: float = 24 * 3600,
+                 gitlab_tag_prefix: str = "gitlab:", page_size: int = 250):
+        """
+        :param refresh_interval: Период инкрементального обновления в секундах
+        :param gitlab_tag_prefix: Префикс тега продукта с ID проекта GitLab (например, "gitlab:123")
+        """
+        self.session = session
+        self.defectdojo_url = defectdojo_url.rstrip('/')
+        self.headers = defectdojo_headers(token)
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        self.gitlab_tag_prefix = gitlab_tag_prefix
+        self.page_size = page_size
+        self.by_name: Dict[str, int] = {}
+        self.by_gitlab_id: Dict[int, int] = {}
+        # None — индекс еще ни разу не обновлялся
+        self._refreshed_at: Optional[float] = None
+        self._refreshing = False
+        # Установлено, когда в индексе есть данные: из SQLite или после первого обновления
+        self._loaded = Event()
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS defectdojo_products ("
+                " id INTEGER PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " gitlab_project_id INTEGER,"
+                " updated TEXT)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS defectdojo_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        for product_id, name, gitlab_project_id in self._conn.execute(
+                "SELECT id, name, gitlab_project_id FROM defectdojo_products"):
+            self._index(product_id, name, gitlab_project_id)
+        if self.by_name:
+            self._loaded.set()
+
+    def product_id(self, project: ProjectInfo) -> Optional[int]:
+        """ID продукта проекта: по тегу с ID проекта GitLab, иначе по имени"""
+        self.ensure_fresh()
+        with self._lock:
+            product_id = self.by_gitlab_id.get(project.id)
+            return product_id if product_id is not None else self.by_name.get(project.name)
+
+    def ensure_fresh(self) -> None:
+        """
+        Обновление индекса, если с прошлого обновления прошло больше refresh_interval.
+        Пока идет первая загрузка пустого индекса, остальные вызовы ждут ее завершения
+        """
+        with self._lock:
+            stale = self._refreshed_at is None or time.monotonic() - self._refreshed_at >= self.refresh_interval
+            if self._refreshing or not stale:
+                refresh = False
+            else:
+                # Параллельные вызовы не запускают обновление повторно
+                self._refreshing = refresh = True
+                last_full = float(self._get_meta('full_refresh') or 0)
+        if not refresh:
+            self._loaded.wait()
+            return
+
+        try:
+            if time.time() - last_full >= self.full_refresh_interval:
+                self.refresh_full()
+            else:
+                self.refresh_incremental()
+        except requests.RequestException as e:
+            print(f"[WARN] Не удалось обновить индекс продуктов DefectDojo: {e}")
+        finally:
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+                self._refreshing = False
+            self._loaded.set()
+
+    def refresh_full(self) -> None:
+        products = list(iter_defectdojo_pages(self.session, f"{self.defectdojo_url}/api/v2/products/",
+                                              self.headers, {'limit': self.page_size}))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM defectdojo_products")
+            self.by_name, self.by_gitlab_id = {}, {}
+            for product in products:
+                self._store(product)
+            self._set_meta('full_refresh', str(time.time()))
+            self._set_meta('watermark', max((p.get('updated') or '' for p in products), default='', key=_parse_updated))
+
+    def refresh_incremental(self) -> None:
+        with self._lock:
+            watermark = self._get_meta('watermark') or ''
+        changed = []
+        for product in iter_defectdojo_pages(self.session, f"{self.defectdojo_url}/api/v2/products/",
+                                             self.headers, {'limit': self.page_size, 'o': '-updated'}):
+            if watermark and _parse_updated(product.get('updated')) <= _parse_updated(watermark):
+                break
+            changed.append(product)
+
+        if not changed:
+            return
+        with self._lock, self._conn:
+            for product in changed:
+                self._store(product)
+            self._set_meta('watermark', changed[0].get('updated') or watermark)
+
+    def _store(self, product: Dict) -> None:
+        gitlab_project_id = self._gitlab_project_id(product)
+        # Переименованный продукт не должен оставаться в индексе под старым именем
+        previous = self._conn.execute("SELECT name, gitlab_project_id FROM defectdojo_products WHERE id = ?",
+                                      (product['id'],)).fetchone()
+        if previous is not None:
+            if self.by_name.get(previous[0]) == product['id']:
+                del self.by_name[previous[0]]
+            if previous[1] is not None and self.by_gitlab_id.get(previous[1]) == product['id']:
+                del self.by_gitlab_id[previous[1]]
+        self._conn.execute("INSERT OR REPLACE INTO defectdojo_products VALUES (?, ?, ?, ?)",
+                           (product['id'], product['name'], gitlab_project_id, product.get('updated')))
+        self._index(product['id'], product['name'], gitlab_project_id)
+
+    def _index(self, product_id: int, name: str, gitlab_project_id: Optional[int]) -> None:
+        self.by_name[name] = product_id
+        if gitlab_project_id is not None:
+            self.by_gitlab_id[gitlab_project_id] = product_id
+
+    def _gitlab_project_id(self, product: Dict) -> Optional[int]:
+        for tag in product.get('tags') or []:
+            if tag.startswith(self.gitlab_tag_prefix) and tag[len(self.gitlab_tag_prefix):].isdigit():
+                return int(tag[len(self.gitlab_tag_prefix):])
+        return None
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM defectdojo_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO defectdojo_meta (key, value) VALUES (?, ?)", (key, value))
+
+
+# Находка учитывается в счетчиках, если удовлетворяет всем условиям
+OPEN_FINDING_FILTERS = {
+    'active': 'true',
+    'verified': 'true',
+    'false_p': 'false',
+    'duplicate': 'false',
+}
+
+
+# Границы возрастных групп находок в днях: до недели, до месяца, до квартала и старше
+DEFAULT_AGE_BUCKETS = (7, 30, 90)
+
+
+def _age_bucket(found: Optional[str], today: date, age_buckets: Sequence[int]) -> int:
+    if not found:
+        return len(age_buckets)
+    age = (today - date.fromisoformat(found[:10])).days
+    for i, limit in enumerate(age_buckets):
+        if age <= limit:
+            return i
+    return len(age_buckets)
+
+
+def _is_open(finding: Dict) -> bool:
+    return (finding.get('active') and finding.get('verified')
+            and not finding.get('false_p') and not finding.get('duplicate'))
+
+
+def _finding_changed_at(finding: Dict) -> Optional[datetime]:
+    value = finding.get('last_status_update') or finding.get('updated')
+    return _parse_updated(value) if value else None
+
+
+def _later(current: Optional[datetime], value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return current
+    return value if current is None or value > current else current
+
+
+def _parse_updated(value: Optional[str]) -> datetime:
+    if not value:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class DefectDojoFindingsStore:
+    """
+    Счетчики открытых находок DefectDojo по продуктам, собираемые одним проходом по всем находкам
+    (active, verified, не false positive и не дубликаты) вместо запросов по каждому проекту.
+    Синхронизация идет в фоновом потоке, чтение счетчика ждет ее завершения.
+
+    После первой полной синхронизации читаются только находки, изменившиеся после водяного знака
+    (last_status_update), и применяются к счетчикам как дельты. Полная сверка раз в full_sync_interval
+    исправляет расхождения из-за удаленных находок, которые инкрементальный проход не видит.
+    Находки и водяной знак хранятся в SQLite, поэтому при запуске из cron синхронизация продолжается
+    инкрементально.
+
+    Старые находки без last_status_update при сортировке по убыванию идут первыми (NULL в PostgreSQL),
+    поэтому инкрементальный проход начинается со смещения за этим блоком; сами такие находки учитывает
+    полная сверка.
+    """
+
+    WATERMARK_KEY = 'findings_watermark'
+    FULL_SYNC_KEY = 'findings_full_sync'
+    NULL_BLOCK_KEY = 'findings_null_block'
+
+    def __init__(self, session, defectdojo_url: str, token: str, product_index: DefectDojoProductIndex,
+                 path: str = "scheduler_cache.sqlite3", page_size: int = 250,
+                 full_sync_interval: float = 24 * 3600, overlap: float = 300):
+        """
+        :param product_index: Индекс для сопоставления проектов GitLab с продуктами
+        :param full_sync_interval: Период полной сверки в секундах
+        :param overlap: Перекрытие водяного знака в секундах (на случай расхождения часов и долгих транзакций)
+        """
+        self.session = session
+        self.defectdojo_url = defectdojo_url.rstrip('/')
+        self.headers = defectdojo_headers(token)
+        self.product_index = product_index
+        self.page_size = page_size
+        self.full_sync_interval = full_sync_interval
+        self.overlap = timedelta(seconds=overlap)
+        # id находки -> (id продукта, severity, date); из находки хранятся только эти поля
+        self.findings: Dict[int, Tuple[int, str, Optional[str]]] = {}
+        self.counts: Dict[int, int] = {}
+        # Разбивка счетчиков продукта по (severity, date): возраст находки вычисляется в момент чтения
+        self.breakdown: Dict[int, Dict[Tuple[str, Optional[str]], int]] = {}
+        # Находка ссылается на тест, тест — на engagement, engagement — на продукт
+        self.test_products: Dict[int, int] = {}
+        self.engagement_products: Dict[int, int] = {}
+        # Тесты, разрешенные после последней записи в SQLite
+        self._unsaved_tests: Dict[int, int] = {}
+        self.watermark: Optional[datetime] = None
+        # Длина блока находок без last_status_update в начале выборки по убыванию last_status_update
+        self.null_block: Optional[int] = None
+        self.synced_at: Optional[float] = None
+        self.full_synced_at: Optional[float] = None
+        self._lock = Lock()
+        self._done = Event()
+        self._done.set()
+        self._thread: Optional[Thread] = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS defectdojo_findings ("
+                " id INTEGER PRIMARY KEY,"
+                " product_id INTEGER NOT NULL,"
+                " severity TEXT NOT NULL,"
+                " found TEXT)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS defectdojo_test_products"
+                               " (test_id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS defectdojo_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._load()
+
+    def _load(self) -> None:
+        """Восстановление счетчиков из SQLite"""
+        for finding_id, product_id, severity, found in self._conn.execute(
+                "SELECT id, product_id, severity, found FROM defectdojo_findings"):
+            self._add(finding_id, (product_id, severity, found))
+        self.test_products = dict(self._conn.execute("SELECT test_id, product_id FROM defectdojo_test_products"))
+        meta = dict(self._conn.execute("SELECT key, value FROM defectdojo_meta WHERE key IN (?, ?, ?)",
+                                       (self.WATERMARK_KEY, self.FULL_SYNC_KEY, self.NULL_BLOCK_KEY)))
+        if self.WATERMARK_KEY in meta:
+            self.watermark = _parse_updated(meta[self.WATERMARK_KEY])
+        if self.FULL_SYNC_KEY in meta:
+            self.full_synced_at = float(meta[self.FULL_SYNC_KEY])
+        if self.NULL_BLOCK_KEY in meta:
+            self.null_block = int(meta[self.NULL_BLOCK_KEY])
+
+    def start_sync(self) -> None:
+        """Запуск синхронизации в фоне (например, одновременно со сбором проектов GitLab)"""
+        with self._lock:
+            if not self._done.is_set():
+                return
+            self._done.clear()
+        self._thread = Thread(target=self._sync_safe, daemon=True)
+        self._thread.start()
+
+    def defect_count(self, project: ProjectInfo) -> int:
+        if self._thread is None:
+            # Синхронизация не запускалась планировщиком — первое обращение запускает ее само
+            self.start_sync()
+        self._done.wait()
+        product_id = self.product_index.product_id(project)
+        with self._lock:
+            return self.counts.get(product_id, 0) if product_id is not None else 0
+
+    def severity_age_counts(self, project: ProjectInfo, age_buckets: Sequence[int] = DEFAULT_AGE_BUCKETS,
+                            today: Optional[date] = None) -> Dict[Tuple[str, int], int]:
+        """
+        Число находок продукта по severity и возрастной группе
+        :param age_buckets: Верхние границы возрастных групп в днях по возрастанию; группа — индекс границы,
+                            len(age_buckets) — находки старше последней границы или без даты
+        """
+        if self._thread is None:
+            self.start_sync()
+        self._done.wait()
+        product_id = self.product_index.product_id(project)
+        today = today or datetime.now(timezone.utc).date()
+        with self._lock:
+            breakdown = dict(self.breakdown.get(product_id, {})) if product_id is not None else {}
+
+        result: Dict[Tuple[str, int], int] = {}
+        for (severity, found), count in breakdown.items():
+            key = (severity, _age_bucket(found, today, age_buckets))
+            result[key] = result.get(key, 0) + count
+        return result
+
+    def weighted_defects(self, project: ProjectInfo, severity_weights: Dict[str, float],
+                         age_weights: Sequence[float], age_buckets: Sequence[int] = DEFAULT_AGE_BUCKETS) -> float:
+        """
+        Взвешенное число находок: сумма severity_weights[severity] * age_weights[группа возраста].
+        Severity, отсутствующая в severity_weights, имеет вес 0
+        """
+        return sum(severity_weights.get(severity, 0.0) * age_weights[bucket] * count
+                   for (severity, bucket), count in self.severity_age_counts(project, age_buckets).items())
+
+    def _sync_safe(self) -> None:
+        try:
+            self.sync()
+        except requests.RequestException as e:
+            print(f"[WARN] Не удалось синхронизировать находки DefectDojo: {e}")
+        finally:
+            self._done.set()
+
+    def sync(self) -> None:
+        if (self.watermark is None or self.full_synced_at is None
+                or time.time() - self.full_synced_at >= self.full_sync_interval):
+            self.sync_full()
+        else:
+            self.sync_incremental()
+
+    def sync_full(self) -> None:
+        """Полное перечитывание открытых находок и пересчет счетчиков"""
+        self._load_test_products()
+        findings = {}
+        watermark = self.watermark
+        for finding in self._iter_findings({**OPEN_FINDING_FILTERS, 'o': 'id'}):
+            watermark = _later(watermark, _finding_changed_at(finding))
+            product_id = self._product_of_test(finding['test'])
+            if product_id is not None:
+                findings[finding['id']] = (product_id, finding.get('severity') or "", finding.get('date'))
+
+        counts: Dict[int, int] = {}
+        breakdown: Dict[int, Dict[Tuple[str, Optional[str]], int]] = {}
+        for product_id, severity, found in findings.values():
+            counts[product_id] = counts.get(product_id, 0) + 1
+            product = breakdown.setdefault(product_id, {})
+            product[(severity, found)] = product.get((severity, found), 0) + 1
+        with self._lock, self._conn:
+            self.findings, self.counts, self.breakdown = findings, counts, breakdown
+            self.watermark = watermark
+            self.synced_at = self.full_synced_at = time.time()
+            self._conn.execute("DELETE FROM defectdojo_findings")
+            self._conn.executemany("INSERT INTO defectdojo_findings VALUES (?, ?, ?, ?)",
+                                   ((finding_id, *entry) for finding_id, entry in findings.items()))
+            self._save_state()
+
+    def sync_incremental(self) -> None:
+        """
+        Находки, изменившиеся после водяного знака, в любом статусе: закрытая или помеченная
+        дубликатом находка должна уйти из счетчиков. Проход читает только находки с last_status_update
+        и стоит страниц изменений, а не всей истории
+        """
+        since = self.watermark - self.overlap
+        null_block = self._find_null_block()
+        changed = []
+        for finding in self._iter_findings({'o': '-last_status_update', 'offset': null_block}):
+            if not finding.get('last_status_update'):
+                # Блок сместился во время прохода; такие находки учтет полная сверка
+                continue
+            if _parse_updated(finding['last_status_update']) < since:
+                break
+            changed.append(finding)
+
+        watermark = self.watermark
+        deltas = []
+        for finding in changed:
+            watermark = _later(watermark, _finding_changed_at(finding))
+            product_id = self._product_of_test(finding['test']) if _is_open(finding) else None
+            entry = (product_id, finding.get('severity') or "", finding.get('date')) if product_id else None
+            deltas.append((finding['id'], entry))
+
+        with self._lock, self._conn:
+            for finding_id, entry in deltas:
+                self._remove(finding_id)
+                self._conn.execute("DELETE FROM defectdojo_findings WHERE id = ?", (finding_id,))
+                if entry is not None:
+                    self._add(finding_id, entry)
+                    self._conn.execute("INSERT INTO defectdojo_findings VALUES (?, ?, ?, ?)", (finding_id, *entry))
+            self.watermark = watermark
+            self.null_block = null_block
+            self.synced_at = time.time()
+            self._save_state()
+
+    def _find_null_block(self) -> int:
+        """
+        Длина блока находок без last_status_update в начале выборки по убыванию last_status_update.
+        Известная длина проверяется одним запросом двух строк на границе блока; если блок изменился
+        (старые находки получают last_status_update при смене статуса), граница ищется бинарным поиском
+        по смещению — O(log N) запросов
+        """
+        known = self.null_block
+        if known is not None:
+            rows, total = self._findings_slice(max(known - 1, 0), 2)
+            if known == 0:
+                boundary = rows[:1]
+            else:
+                boundary = rows[1:2] if rows and not rows[0].get('last_status_update') else None
+            if boundary is not None and all(row.get('last_status_update') for row in boundary):
+                return known
+        else:
+            _, total = self._findings_slice(0, 1)
+
+        low, high = 0, total
+        while low < high:
+            middle = (low + high) // 2
+            rows, _ = self._findings_slice(middle, 1)
+            if not rows or rows[0].get('last_status_update'):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _findings_slice(self, offset: int, limit: int) -> Tuple[List[Dict], int]:
+        """Находки в порядке убывания last_status_update со смещения offset и общее число находок"""
+        response = self.session.get(f"{self.defectdojo_url}/api/v2/findings/", headers=self.headers,
+                                    params={'o': '-last_status_update', 'limit': limit, 'offset': offset},
+                                    timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        return data.get('results', []), data.get('count', 0)
+
+    def _save_state(self) -> None:
+        """Запись водяного знака, времени полной сверки и справочника тестов (в открытой транзакции)"""
+        if self.watermark is not None:
+            self._conn.execute("INSERT OR REPLACE INTO defectdojo_meta (key, value) VALUES (?, ?)",
+                               (self.WATERMARK_KEY, self.watermark.isoformat()))
+        if self.full_synced_at is not None:
+            self._conn.execute("INSERT OR REPLACE INTO defectdojo_meta (key, value) VALUES (?, ?)",
+                               (self.FULL_SYNC_KEY, str(self.full_synced_at)))
+        if self.null_block is not None:
+            self._conn.execute("INSERT OR REPLACE INTO defectdojo_meta (key, value) VALUES (?, ?)",
+                               (self.NULL_BLOCK_KEY, str(self.null_block)))
+        self._conn.executemany("INSERT OR REPLACE INTO defectdojo_test_products VALUES (?, ?)",
+                               list(self._unsaved_tests.items()))
+        self._unsaved_tests.clear()
+
+    def _add(self, finding_id: int, entry: Tuple[int, str, Optional[str]]) -> None:
+        self.findings[finding_id] = entry
+        self.counts[entry[0]] = self.counts.get(entry[0], 0) + 1
+        product = self.breakdown.setdefault(entry[0], {})
+        product[entry[1:]] = product.get(entry[1:], 0) + 1
+
+    def _remove(self, finding_id: int) -> None:
+        entry = self.findings.pop(finding_id, None)
+        if entry is not None:
+            self.counts[entry[0]] -= 1
+            product = self.breakdown[entry[0]]
+            product[entry[1:]] -= 1
+            if not product[entry[1:]]:
+                del product[entry[1:]]
+
+    def _iter_findings(self, params: Dict) -> Iterator[Dict]:
+        return iter_defectdojo_pages(self.session, f"{self.defectdojo_url}/api/v2/findings/", self.headers,
+                                     {'limit': self.page_size, **params})
+
+    def _load_test_products(self) -> None:
+        for engagement in iter_defectdojo_pages(self.session, f"{self.defectdojo_url}/api/v2/engagements/",
+                                                self.headers, {'limit': self.page_size}):
+            self.engagement_products[engagement['id']] = engagement['product']
+        for test in iter_defectdojo_pages(self.session, f"{self.defectdojo_url}/api/v2/tests/",
+                                          self.headers, {'limit': self.page_size}):
+            product_id = self.engagement_products.get(test['engagement'])
+            if product_id is not None and self.test_products.get(test['id']) != product_id:
+                self.test_products[test['id']] = self._unsaved_tests[test['id']] = product_id
+
+    def _product_of_test(self, test_id: int) -> Optional[int]:
+        """Продукт теста; тесты, созданные после загрузки справочника, запрашиваются по одному"""
+        product_id = self.test_products.get(test_id)
+        if product_id is not None:
+            return product_id
+        response = self.session.get(f"{self.defectdojo_url}/api/v2/tests/{test_id}/", headers=self.headers,
+                                    timeout=30)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        engagement_id = response.json()['engagement']
+        product_id = self.engagement_products.get(engagement_id)
+        if product_id is None:
+            response = self.session.get(f"{self.defectdojo_url}/api/v2/engagements/{engagement_id}/",
+                                        headers=self.headers, timeout=30)
+            response.raise_for_status()
+            product_id = self.engagement_products[engagement_id] = response.json()['product']
+        self.test_products[test_id] = self._unsaved_tests[test_id] = product_id
+        return product_id
+
+
+class DefectCountMemo:
+    """
+    Кэш числа дефектов по ID продукта с TTL и вытеснением давно не использованных записей (LRU).
+    Число находок меняется только при импорте скана, поэтому запись сбрасывается явно через invalidate
+    (по событию завершения пайплайна фаззинга или по опросу новых тестов, см. DefectDojoImportPoller)
+    """
+
+    def __init__(self, ttl: float = 6 * 3600, maxsize: int = 4096, import_poller=None):
+        """
+        :param ttl: Время жизни записи в секундах — страховка на случай пропущенного события импорта
+        :param import_poller: Источник продуктов с новыми импортами (например, DefectDojoImportPoller)
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.import_poller = import_poller
+        self._entries: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def lookup(self, product_id: int) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[1]:
+                del self._entries[product_id]
+                return None
+            self._entries.move_to_end(product_id)
+            return entry[0]
+
+    def store(self, product_id: int, count: int) -> None:
+        with self._lock:
+            self._entries[product_id] = (count, time.monotonic() + self.ttl)
+            self._entries.move_to_end(product_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, product_id: Optional[int] = None) -> None:
+        """Сброс записи продукта (None — всех записей)"""
+        with self._lock:
+            if product_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(product_id, None)
+
+    def check_imports(self) -> None:
+        """Сброс записей продуктов, в которые с прошлой проверки импортированы сканы"""
+        if self.import_poller is None:
+            return
+        try:
+            product_ids = self.import_poller.poll()
+        except requests.RequestException as e:
+            print(f"[WARN] Не удалось проверить импорты сканов DefectDojo: {e}")
+            return
+        if product_ids is None:
+            self.invalidate()
+            return
+        for product_id in product_ids:
+            self.invalidate(product_id)
+
+
+class DefectDojoImportPoller:
+    """
+    Обнаружение импортов сканов по списку тестов DefectDojo: каждый импорт создает тест (или обновляет
+    существующий при reimport). Запрашиваются тесты в порядке убывания updated до последнего известного,
+    поэтому цикл без импортов стоит одного запроса с limit=page_size.
+    """
+
+    def __init__(self, session, defectdojo_url: str, token: str, page_size: int = 50):
+        self.session = session
+        self.defectdojo_url = defectdojo_url.rstrip('/')
+        self.headers = defectdojo_headers(token)
+        self.page_size = page_size
+        self.watermark: Optional[datetime] = None
+        self.engagement_products: Dict[int, int] = {}
+
+    def poll(self) -> Optional[List[int]]:
+        """
+        ID продуктов с новыми тестами с прошлого опроса (первый опрос только запоминает состояние).
+        None — затронутые продукты определить не удалось
+        """
+        response = self.session.get(f"{self.defectdojo_url}/api/v2/tests/", headers=self.headers,
+                                    params={'o': '-updated', 'limit': self.page_size}, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        tests = data.get('results', [])
+
+        if self.watermark is None:
+            self.watermark = _latest_update(tests) or datetime.now(timezone.utc)
+            return []
+
+        changed = [t for t in tests if _parse_updated(t.get('updated')) > self.watermark]
+        if len(changed) == len(tests) and data.get('next'):
+            # Изменений больше, чем помещается на страницу: затронутые продукты неизвестны,
+            # вызывающий сбрасывает все записи, поэтому watermark можно сдвинуть
+            self.watermark = _latest_update(changed) or self.watermark
+            return None
+        # Watermark сдвигается только после определения всех продуктов: при ошибке запроса
+        # engagement тесты будут обработаны повторно на следующем опросе
+        products = [self._product_of_engagement(t['engagement']) for t in changed]
+        self.watermark = _latest_update(changed) or self.watermark
+        return products
+
+    def _product_of_engagement(self, engagement_id: int) -> int:
+        product_id = self.engagement_products.get(engagement_id)
+        if product_id is None:
+            response = self.session.get(f"{self.defectdojo_url}/api/v2/engagements/{engagement_id}/",
+                                        headers=self.headers, timeout=30)
+            response.raise_for_status()
+            product_id = self.engagement_products[engagement_id] = response.json()['product']
+        return product_id
+
+
+def _latest_update(items: List[Dict]) -> Optional[datetime]:
+    return max((_parse_updated(i['updated']) for i in items if i.get('updated')), default=None)
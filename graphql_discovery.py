@@ -0,0 +1,215 @@
+import re
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+import gitlab
+import requests
+
+from main import FuzzingPipelineScheduler, ProjectInfo, parse_gitlab_datetime
+
+# Фрагменты запроса для фактов о проекте. Поля, которые инстанс не поддерживает,
+# исключаются из запроса и запрашиваются через REST API
+REPOSITORY_FIELDS = {
+    'tree': 'tree(ref: "main") { lastCommit { committedDate } }',
+    'blobs': 'blobs(paths: [".gitlab-ci.yml"], ref: "main") { nodes { path oid } }',
+}
+PROJECT_FIELDS = {
+    'pipelines': 'pipelines(ref: "main", first: 1) { count nodes { updatedAt } }',
+}
+
+# Соответствие имени поля из текста ошибки GraphQL фрагменту запроса
+ERROR_FIELD_TO_FRAGMENT = {
+    'tree': 'tree',
+    'lastCommit': 'tree',
+    'committedDate': 'tree',
+    'blobs': 'blobs',
+    'pipelines': 'pipelines',
+    'count': 'pipelines',
+    'updatedAt': 'pipelines',
+}
+
+UNSUPPORTED_FIELD_RE = re.compile(r"Field '(\w+)' doesn't (?:exist on type|accept argument)")
+
+
+def parse_graphql_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Разбор скаляра Time из GraphQL API GitLab: ISO 8601 без долей секунды ("2021-03-09T14:58:50Z")"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def build_projects_query(unsupported: Set[str]) -> str:
+    repository = " ".join(f for k, f in REPOSITORY_FIELDS.items() if k not in unsupported)
+    project = " ".join(f for k, f in PROJECT_FIELDS.items() if k not in unsupported)
+    return (
+        "query($fullPath: ID!, $first: Int!, $after: String) {"
+        " group(fullPath: $fullPath) {"
+        " projects(includeSubgroups: true, first: $first, after: $after) {"
+        " pageInfo { hasNextPage endCursor }"
+        " nodes { id name fullPath webUrl archived"
+        f" repository {{ rootRef {repository} }} {project} }}"
+        " } } }"
+    )
+
+
+class GraphQLError(Exception):
+    pass
+
+
+class GitlabGraphQLTransport:
+    """Отправка запросов в GraphQL API GitLab"""
+
+    def __init__(self, gitlab_url: str, headers: Dict[str, str], session: Optional[requests.Session] = None,
+                 timeout: float = 30):
+        self.url = f"{gitlab_url.rstrip('/')}/api/graphql"
+        self.headers = headers
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def execute(self, query: str, variables: Dict) -> Dict:
+        response = self.session.post(self.url, headers=self.headers, json={'query': query, 'variables': variables},
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class GraphQLProjectDiscovery:
+    """
+    Сбор ProjectInfo для всех проектов группы через GraphQL: один запрос на страницу из page_size проектов.
+    Факты, недоступные в GraphQL на данном инстансе, дополняются через REST API.
+    """
+
+    def __init__(self, scheduler: FuzzingPipelineScheduler, transport=None, page_size: int = 100):
+        self.scheduler = scheduler
+        self.transport = transport or GitlabGraphQLTransport(scheduler.gitlab_url, scheduler.headers,
+                                                                     session=scheduler.session)
+        self.page_size = page_size
+        self.unsupported: Set[str] = set()
+        self.rest_fallbacks: Dict[str, Callable] = {
+            'tree': self._rest_main_branch,
+            'blobs': self._rest_ci_file,
+            'pipelines': self._rest_pipelines,
+        }
+
+    def get_fuzzing_projects(self) -> List[ProjectInfo]:
+        result: List[ProjectInfo] = []
+        full_path = self.scheduler.group.full_path
+        after = None
+
+        while True:
+            page = self._fetch_page(full_path, after)
+            for node in page['nodes']:
+                project = self._build_project_info(node)
+                if project is not None:
+                    result.append(project)
+
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+
+        return result
+
+    def _fetch_page(self, full_path: str, after: Optional[str]) -> Dict:
+        while True:
+            response = self.transport.execute(build_projects_query(self.unsupported),
+                                              {'fullPath': full_path, 'first': self.page_size, 'after': after})
+            errors = response.get('errors')
+            if not errors:
+                group = response['data']['group']
+                if group is None:
+                    raise GraphQLError(f"Группа {full_path} не найдена")
+                return group['projects']
+
+            missing = set()
+            for error in errors:
+                match = UNSUPPORTED_FIELD_RE.search(error.get('message', ''))
+                if match and match.group(1) in ERROR_FIELD_TO_FRAGMENT:
+                    missing.add(ERROR_FIELD_TO_FRAGMENT[match.group(1)])
+            if not missing or missing <= self.unsupported:
+                raise GraphQLError("; ".join(e.get('message', '') for e in errors))
+
+            print(f"[WARN] GraphQL не поддерживает поля {sorted(missing - self.unsupported)}, используется REST API")
+            self.unsupported |= missing
+
+    def _build_project_info(self, node: Dict) -> Optional[ProjectInfo]:
+        repository = node.get('repository') or {}
+        facts = {
+            'main_branch_exists': False,
+            'last_modified': None,
+            'has_gitlab_ci_file': False,
+            'last_pipeline_run': None,
+            'pipeline_run_count': 0,
+            'ci_blob_id': None,
+        }
+
+        if 'tree' not in self.unsupported:
+            # tree(ref: "main") возвращается и для несуществующей ветки, но без lastCommit
+            last_commit = (repository.get('tree') or {}).get('lastCommit')
+            facts['main_branch_exists'] = last_commit is not None
+            if last_commit:
+                facts['last_modified'] = parse_graphql_datetime(last_commit['committedDate'])
+        if 'blobs' not in self.unsupported:
+            blobs = repository.get('blobs') or {}
+            facts['has_gitlab_ci_file'] = bool(blobs.get('nodes'))
+            if blobs.get('nodes'):
+                facts['ci_blob_id'] = blobs['nodes'][0].get('oid')
+        if 'pipelines' not in self.unsupported:
+            pipelines = node.get('pipelines') or {}
+            facts['pipeline_run_count'] = pipelines.get('count') or 0
+            if pipelines.get('nodes'):
+                facts['last_pipeline_run'] = parse_graphql_datetime(pipelines['nodes'][0]['updatedAt'])
+
+        project_id = int(node['id'].rsplit('/', 1)[-1])
+        if self.unsupported:
+            project = self.scheduler.gl.projects.get(project_id, lazy=True)
+            try:
+                # Проверка ветки main выполняется первой: остальные факты имеют смысл только при её наличии
+                for key in sorted(self.unsupported, key=lambda k: k != 'tree'):
+                    if key == 'tree' or facts['main_branch_exists']:
+                        self.rest_fallbacks[key](project, facts)
+            except gitlab.exceptions.GitlabGetError:
+                return None
+            except gitlab.exceptions.GitlabHeadError as e:
+                print(f"[WARN] Не удалось проверить .gitlab-ci.yml проекта {node['fullPath']}: {e}")
+                return None
+
+        return ProjectInfo(
+            id=project_id,
+            name=node['name'],
+            path_with_namespace=node['fullPath'],
+            web_url=node['webUrl'],
+            main_branch_exists=facts['main_branch_exists'],
+            has_gitlab_ci_file=facts['has_gitlab_ci_file'],
+            last_modified=facts['last_modified'],
+            last_pipeline_run=facts['last_pipeline_run'],
+            pipeline_run_count=facts['pipeline_run_count'],
+            default_branch=repository.get('rootRef') or "main",
+            archived=node['archived'],
+            ci_blob_id=facts['ci_blob_id']
+        )
+
+    def _rest_main_branch(self, project, facts: Dict) -> None:
+        try:
+            project.branches.get("main")
+        except gitlab.exceptions.GitlabGetError:
+            return
+        facts['main_branch_exists'] = True
+        commits = project.commits.list(ref_name="main", per_page=1)
+        if commits:
+            facts['last_modified'] = parse_gitlab_datetime(commits[0].committed_date)
+
+    def _rest_ci_file(self, project, facts: Dict) -> None:
+        try:
+            headers = project.files.head(".gitlab-ci.yml", ref="main")
+            facts['has_gitlab_ci_file'] = True
+            facts['ci_blob_id'] = headers.get('X-Gitlab-Blob-Id')
+        except gitlab.exceptions.GitlabHeadError as e:
+            # Отсутствие файла — только 404: 403 и 5xx не должны исключать проект из фаззинга
+            if e.response_code != 404:
+                raise
+
+    def _rest_pipelines(self, project, facts: Dict) -> None:
+        summary = self.scheduler.pipeline_summary.fetch(project)
+        facts['pipeline_run_count'] = summary.pipeline_run_count
+        facts['last_pipeline_run'] = summary.last_pipeline_run
@@ -0,0 +1,192 @@
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from threading import Condition
+from typing import Dict, Mapping, Optional, Set
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RequestGovernor:
+    """
+    Общий регулятор параллельности запросов к GitLab (AIMD).
+    Лимит одновременных запросов растет на additive_step за каждый «раунд» успешных ответов
+    и умножается на decrease_factor при 429 или при исчерпании RateLimit-Remaining.
+    Retry-After и RateLimit-Reset приостанавливают выдачу новых слотов до указанного времени.
+    """
+
+    def __init__(self, initial_limit: float = 8, min_limit: float = 1, max_limit: float = 64,
+                 additive_step: float = 1.0, decrease_factor: float = 0.5, low_remaining_ratio: float = 0.1):
+        """
+        :param low_remaining_ratio: Доля RateLimit-Remaining от RateLimit-Limit, ниже которой лимит снижается
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.additive_step = additive_step
+        self.decrease_factor = decrease_factor
+        self.low_remaining_ratio = low_remaining_ratio
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.rate_limit_remaining: Optional[int] = None
+        self.requests_total = 0
+        self.throttled_total = 0
+        self.wait_seconds_total = 0.0
+        self._last_decrease = 0.0
+        self._condition = Condition()
+
+    def try_acquire(self) -> float:
+        """Попытка занять слот. Возвращает 0, если слот занят, иначе рекомендуемое время ожидания в секундах"""
+        with self._condition:
+            delay = self.paused_until - time.monotonic()
+            if delay > 0:
+                return delay
+            if self.in_flight >= int(self.limit):
+                return 0.05
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self) -> None:
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                delay = self.paused_until - time.monotonic()
+                if delay <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    break
+                self._condition.wait(timeout=delay if delay > 0 else None)
+            self.wait_seconds_total += time.monotonic() - started
+
+    def release(self, status_code: Optional[int] = None, headers: Optional[Mapping[str, str]] = None) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if status_code is not None:
+                self._observe(status_code, headers or {})
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        Слот для одного запроса. В блок передается словарь, в который записывается ответ:
+        with governor.slot() as result: result['response'] = session.get(...)
+        """
+        self.acquire()
+        result: Dict = {}
+        try:
+            yield result
+        finally:
+            response = result.get('response')
+            if response is None:
+                self.release()
+            else:
+                self.release(response.status_code, response.headers)
+
+    def _observe(self, status_code: int, headers: Mapping[str, str]) -> None:
+        now = time.monotonic()
+        self.requests_total += 1
+
+        remaining = _int_header(headers, 'RateLimit-Remaining')
+        limit = _int_header(headers, 'RateLimit-Limit')
+        if remaining is not None:
+            self.rate_limit_remaining = remaining
+
+        if status_code == 429:
+            self.throttled_total += 1
+            self._decrease(now)
+            self.paused_until = max(self.paused_until, now + _retry_delay(headers))
+            return
+
+        if remaining is not None and limit:
+            if remaining == 0:
+                self._decrease(now)
+                self.paused_until = max(self.paused_until, now + _retry_delay(headers))
+                return
+            if remaining < limit * self.low_remaining_ratio:
+                self._decrease(now)
+                return
+
+        # Аддитивный рост: за limit успешных ответов лимит увеличивается на additive_step
+        self.limit = min(self.max_limit, self.limit + self.additive_step / self.limit)
+
+    def _decrease(self, now: float) -> None:
+        # Одна волна отказов снижает лимит один раз, а не на каждый ответ в полете
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+    def metrics(self) -> Dict[str, float]:
+        """Текущее состояние регулятора для мониторинга"""
+        with self._condition:
+            return {
+                'concurrency_limit': self.limit,
+                'in_flight': self.in_flight,
+                'paused_for_seconds': max(0.0, self.paused_until - time.monotonic()),
+                'rate_limit_remaining': self.rate_limit_remaining,
+                'requests_total': self.requests_total,
+                'throttled_total': self.throttled_total,
+                'wait_seconds_total': self.wait_seconds_total,
+            }
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _retry_delay(headers: Mapping[str, str], default: float = 1.0) -> float:
+    """Время ожидания по Retry-After (секунды или HTTP-дата) либо по RateLimit-Reset (unix time)"""
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        if retry_after.isdigit():
+            return float(retry_after)
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            pass
+    reset = _int_header(headers, 'RateLimit-Reset')
+    if reset is not None:
+        return max(0.0, reset - time.time())
+    return default
+
+
+class GovernedSession(requests.Session):
+    """
+    requests.Session, пропускающая запросы к заданным хостам через RequestGovernor.
+    Ответ 429 повторяется после паузы, выставленной регулятором, не больше max_retries раз.
+    Подходит для python-gitlab: gitlab.Gitlab(..., session=GovernedSession(...))
+    """
+
+    def __init__(self, governor: RequestGovernor, hosts: Optional[Set[str]] = None, max_retries: int = 3):
+        """
+        :param hosts: Хосты, запросы к которым регулируются (None — все)
+        """
+        super().__init__()
+        self.governor = governor
+        self.hosts = hosts
+        self.max_retries = max_retries
+
+    def configure_pool(self, base_url: str, pool_maxsize: int) -> None:
+        """
+        Отдельный пул keep-alive соединений для хоста.
+        pool_block: при занятом пуле поток ждет освобождения соединения, а не открывает новое
+        с повторным TLS рукопожатием
+        """
+        self.mount(base_url.rstrip('/') + '/',
+                   HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True))
+
+    def request(self, method, url, *args, **kwargs):
+        if self.hosts is not None and urlsplit(url).hostname not in self.hosts:
+            return super().request(method, url, *args, **kwargs)
+
+        for _ in range(self.max_retries + 1):
+            with self.governor.slot() as result:
+                result['response'] = super().request(method, url, *args, **kwargs)
+            if result['response'].status_code != 429:
+                break
+        return result['response']
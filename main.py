@@ -1,10 +1,19 @@
 from dataclasses import dataclass
 
 import gitlab
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from threading import Event, Lock
+from urllib.parse import urlsplit
 import requests
 
+from capacity_forecast import plan_dispatches
+from http_client import GovernedSession, RequestGovernor
+from runners import FuzzJobTagResolver, RunnerCapacityModel, RunnerRegistry, fetch_runner_capacity
+
 @dataclass
 class ProjectInfo:
     id: int
@@ -18,112 +27,472 @@ class ProjectInfo:
     pipeline_run_count: int
     default_branch: str
     archived: bool
+    ci_blob_id: Optional[str] = None
+
+def parse_gitlab_datetime(value: Optional[str]) -> Optional[datetime]:
+    """Разбор даты из ответа GitLab API (ISO 8601 с миллисекундами и часовым поясом)"""
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+@dataclass
+class PipelineSummary:
+    last_pipeline_run: Optional[datetime]
+    pipeline_run_count: int
+
+class PipelineSummaryTracker:
+    """
+    Сводка по пайплайнам ветки main за один запрос на проект.
+    Последний пайплайн берется из первой страницы, отсортированной по id, а число запусков ведется
+    локальным счетчиком: при каждом вызове к нему добавляются пайплайны с id больше последнего виденного.
+    X-Total используется для сверки, когда GitLab его отдает (для списков больше 10k строк он опускается).
+    Начальное значение без X-Total определяется поиском последней страницы, а счетчик сохраняется
+    в store (например, ProjectStore), чтобы не определять его заново при каждом запуске.
+    """
+
+    STORE_FACT = 'pipeline_counter'
+
+    def __init__(self, page_size: int = 100, store=None):
+        self.page_size = page_size
+        self.store = store
+        # project_id -> (число запусков, максимальный виденный id пайплайна)
+        self.state: Dict[int, tuple] = {}
+        self._lock = Lock()
+
+    def fetch(self, project) -> PipelineSummary:
+        """Получение сводки через python-gitlab (project — объект проекта или lazy handle)"""
+        pipelines = project.pipelines.list(ref="main", order_by="id", sort="desc",
+                                           per_page=self.page_size, iterator=True)
+        # islice не выходит за пределы первой страницы, поэтому запрос ровно один
+        page = [(p.id, p.updated_at) for p in islice(pipelines, self.page_size)]
+        total = pipelines.total
+        if self.needs_seed(project.id, page, total):
+            total = self.count_pages(lambda n: len(project.pipelines.list(
+                ref="main", per_page=self.page_size, page=n, get_all=False)))
+        return self.update(project.id, page, total)
+
+    def needs_seed(self, project_id: int, page: List[tuple], total: Optional[int]) -> bool:
+        """Нужен ли поиск общего числа пайплайнов: X-Total нет, счетчика нет, а первая страница заполнена"""
+        return total is None and len(page) >= self.page_size and self.known(project_id) is None
+
+    def count_pages(self, page_length: Callable[[int], int]) -> int:
+        """
+        Общее число пайплайнов по числу элементов на страницах: экспоненциальный, затем бинарный поиск
+        последней непустой страницы — O(log N) запросов, выполняется один раз на проект
+        """
+        search = self.page_search()
+        page = next(search)
+        try:
+            while True:
+                page = search.send(page_length(page))
+        except StopIteration as result:
+            return result.value
+
+    def page_search(self):
+        """Генератор номеров страниц для count_pages и асинхронных аналогов: в ответ принимает число элементов страницы"""
+        full, upper = 1, 2
+        # Первая страница заполнена: ищется первая неполная страница, удваивая номер
+        while True:
+            length = yield upper
+            if length < self.page_size:
+                break
+            full, upper = upper, upper * 2
+        if length > 0:
+            return (upper - 1) * self.page_size + length
+        # Страница upper пуста: последняя непустая страница между full и upper
+        while upper - full > 1:
+            middle = (full + upper) // 2
+            length = yield middle
+            if length == self.page_size:
+                full = middle
+            elif length == 0:
+                upper = middle
+            else:
+                return (middle - 1) * self.page_size + length
+        return full * self.page_size
+
+    def known(self, project_id: int) -> Optional[tuple]:
+        """Известное состояние счетчика (число запусков, максимальный id) из памяти или store; None — не определялось"""
+        with self._lock:
+            known = self.state.get(project_id)
+        if known is None and self.store is not None:
+            cached = self.store.get_fact(project_id, self.STORE_FACT)
+            if cached is not None and cached.value:
+                known = tuple(cached.value)
+                with self._lock:
+                    known = self.state.setdefault(project_id, known)
+        return known
+
+    def pipeline_run_count(self, project_id: int) -> int:
+        known = self.known(project_id)
+        return known[0] if known else 0
+
+    def update(self, project_id: int, page: List[tuple], total: Optional[int]) -> PipelineSummary:
+        """
+        Обновление счетчика по первой странице пайплайнов
+        :param page: Пары (id, updated_at) в порядке убывания id
+        :param total: Значение X-Total, если GitLab его вернул
+        """
+        last_pipeline_run = parse_gitlab_datetime(page[0][1]) if page else None
+        max_id = page[0][0] if page else 0
+        self.known(project_id)
+
+        with self._lock:
+            known = self.state.get(project_id)
+            if total is not None:
+                count = int(total)
+            elif known is None:
+                # Без X-Total начальное значение точно только для неполной страницы
+                count = len(page)
+            else:
+                known_count, known_max_id = known
+                count = known_count + sum(1 for pipeline_id, _ in page if pipeline_id > known_max_id)
+                max_id = max(max_id, known_max_id)
+
+            self.state[project_id] = (count, max_id)
+
+        if self.store is not None and known != (count, max_id):
+            self.store.put_fact(project_id, self.STORE_FACT, [count, max_id])
+        return PipelineSummary(last_pipeline_run=last_pipeline_run, pipeline_run_count=count)
+
+# Поля ProjectInfo, которые берутся из листинга группы без отдельного запроса проекта
+LISTING_FIELDS = ('name', 'path_with_namespace', 'web_url', 'default_branch')
+
+def listing_fields(project_stub) -> Optional[Dict]:
+    """
+    Метаданные проекта из ответа листинга группы. None, если какого-то поля нет и нужен полный запрос.
+    Листинг отбирает только неархивные проекты, поэтому отсутствующий признак archived означает False.
+    """
+    attributes = getattr(project_stub, 'attributes', None) or {}
+    if any(field not in attributes for field in LISTING_FIELDS):
+        return None
+    fields = {field: attributes[field] for field in LISTING_FIELDS}
+    fields['archived'] = attributes.get('archived', False)
+    return fields
+
+class CiFileProbe:
+    """
+    Проверка наличия .gitlab-ci.yml без загрузки содержимого: HEAD запрос к files API.
+    Результат кэшируется по SHA головного коммита main и перепроверяется только после его изменения.
+    """
+
+    def __init__(self):
+        # project_id -> (SHA коммита, наличие файла, X-Gitlab-Blob-Id)
+        self.cache: Dict[int, Tuple[str, bool, Optional[str]]] = {}
+
+    def has_ci_file(self, project, head_sha: str) -> bool:
+        cached = self.cached(project.id, head_sha)
+        if cached is not None:
+            return cached[0]
+
+        try:
+            headers = project.files.head(".gitlab-ci.yml", ref=head_sha)
+            exists, blob_id = True, headers.get('X-Gitlab-Blob-Id')
+        except gitlab.exceptions.GitlabHeadError as e:
+            # Кэшируется только отсутствие файла: 403, 5xx и исчерпанные повторы 429 проверяются снова
+            if e.response_code != 404:
+                raise
+            exists, blob_id = False, None
+
+        self.remember(project.id, head_sha, exists, blob_id)
+        return exists
+
+    def cached(self, project_id: int, head_sha: Optional[str]) -> Optional[Tuple[bool, Optional[str]]]:
+        """Наличие файла и blob id, проверенные на коммите head_sha, или None, если проверки не было"""
+        cached = self.cache.get(project_id)
+        if head_sha is None or cached is None or cached[0] != head_sha:
+            return None
+        return cached[1], cached[2]
+
+    def remember(self, project_id: int, head_sha: str, exists: bool, blob_id: Optional[str]) -> None:
+        self.cache[project_id] = (head_sha, exists, blob_id)
+
+    def blob_id(self, project_id: int) -> Optional[str]:
+        cached = self.cache.get(project_id)
+        return cached[2] if cached else None
 
 class FuzzingPipelineScheduler:
-    def __init__(self, gitlab_url: str, private_token: str, group_id: int):
+    def __init__(self, gitlab_url: str, private_token: str, group_id: int, max_workers: int = 8,
+                 defectdojo_url: Optional[str] = None, defectdojo_token: Optional[str] = None,
+                 streaming: bool = False, stream_depth: int = 32, pool_sizes: Optional[Dict[str, int]] = None,
+                 runner_concurrency: Optional[Dict[int, int]] = None, default_runner_concurrency: int = 1):
         """
         Инициализация планировщика
         :param gitlab_url: URL GitLab инстанса
         :param private_token: Personal Access Token (права: read_api, read_repository, write_repository)
         :param group_id: ID группы проектов для фаззинга
+        :param max_workers: Число потоков для параллельного сбора информации о проектах (1 — последовательно)
+        :param defectdojo_url: URL DefectDojo (необязательно)
+        :param defectdojo_token: API токен DefectDojo (необязательно)
+        :param streaming: Потоковый режим: фильтрация и запросы дефектов начинаются по мере сбора проектов
+        :param stream_depth: Максимальное число элементов в работе на каждой стадии сбора и потокового режима
+        :param pool_sizes: Размеры пулов соединений по базовому URL (по умолчанию для GitLab —
+                           максимальный лимит регулятора, для DefectDojo — max_workers)
+        :param runner_concurrency: Лимиты одновременных задач по id раннера (concurrent/limit из config.toml)
+        :param default_runner_concurrency: Лимит для раннеров, не указанных в runner_concurrency
         """
-        self.gl = gitlab.Gitlab(gitlab_url, private_token=private_token)
+        self.gitlab_url = gitlab_url.rstrip('/')
+        self.headers = {'PRIVATE-TOKEN': private_token}
+        self.defectdojo_url = defectdojo_url.rstrip('/') if defectdojo_url else None
+        self.defectdojo_token = defectdojo_token
+        # Все запросы к GitLab (python-gitlab и прямые) проходят через общий регулятор параллельности
+        self.governor = RequestGovernor(initial_limit=max_workers, max_limit=max(64, max_workers))
+        # Общий пул keep-alive соединений для всех исходящих запросов (GitLab и DefectDojo)
+        self.session = GovernedSession(self.governor, hosts={urlsplit(self.gitlab_url).hostname})
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+        default_pool_sizes = {self.gitlab_url: int(self.governor.max_limit)}
+        if self.defectdojo_url:
+            default_pool_sizes[self.defectdojo_url] = max_workers
+        for base_url, size in {**default_pool_sizes, **(pool_sizes or {})}.items():
+            self.session.configure_pool(base_url, size)
+        self.gl = gitlab.Gitlab(gitlab_url, private_token=private_token, session=self.session)
         self.group_id = group_id
+        self.max_workers = max(1, max_workers)
+        self.streaming = streaming
+        self.stream_depth = max(1, stream_depth)
+        self.runner_concurrency = runner_concurrency or {}
+        self.default_runner_concurrency = default_runner_concurrency
         self.group = self.gl.groups.get(group_id)
+        self.pipeline_summary = PipelineSummaryTracker()
+        self.ci_file_probe = CiFileProbe()
+        self.job_tags = FuzzJobTagResolver(self.session, self.gitlab_url, self.headers)
+        # Кэш состояния раннеров с фоновым обновлением (см. start_runner_registry)
+        self.runner_registry: Optional[RunnerRegistry] = None
+        # Альтернативный источник данных о проектах (например, GraphQLProjectDiscovery)
+        self.discovery_backend = None
+        # Кэш фактов о проектах между запусками (например, CachedProjectEnricher)
+        self.project_cache = None
+        # Индекс продуктов DefectDojo (например, DefectDojoProductIndex); без него продукт ищется по имени
+        self.product_index = None
+        # Счетчики находок по продуктам из общей синхронизации (например, DefectDojoFindingsStore)
+        self.defect_store = None
+        # Кэш числа дефектов по продукту со сбросом при импорте скана (например, DefectCountMemo)
+        self.defect_memo = None
+        # Временной ряд загрузки раннеров для прогноза емкости (например, RunnerUtilizationStore)
+        self.utilization_store = None
+        self.cycle_interval = timedelta(minutes=10)
+        # Минимальная пауза между циклами, даже если окно плана уже наступило
+        self.min_cycle_delay = timedelta(minutes=1)
+        self.forecast_horizon = 6
+        # План запуска отложенных проектов по прогнозным окнам, обновляется в каждом цикле
+        self.dispatch_plan: List[Tuple[datetime, List[ProjectInfo]]] = []
 
         self.weights = {
             'last_change': 0.3,
             'runs_count': 0.2,
             'defects': 0.4
         }
+        # Фактор дефектов при заданном defect_store: находки взвешиваются по severity и возрастной группе
+        # (до 7, 30, 90 дней и старше — границы DEFAULT_AGE_BUCKETS из defectdojo)
+        self.severity_weights = {'Critical': 10.0, 'High': 5.0, 'Medium': 2.0, 'Low': 1.0, 'Info': 0.0}
+        self.defect_age_weights = [1.0, 0.8, 0.6, 0.4]
 
     def get_available_runners(self) -> List[Dict]:
-        available_runners = []
-        url = f"{self.gitlab_url}/api/v4/groups/{self.group_id}/runners"
-        page = 1
+        """
+        Активные раннеры всех уровней: общие раннеры инстанса, раннеры группы и раннеры проектов.
+        Уровни запрашиваются параллельно, раннер, попавший в несколько списков, учитывается один раз
+        """
+        scopes = [
+            (f"/groups/{self.group_id}/runners", 'instance_type'),
+            (f"/groups/{self.group_id}/runners", 'group_type'),
+            # Раннеры проектов, доступные владельцу токена
+            ("/runners", 'project_type'),
+        ]
+        with ThreadPoolExecutor(max_workers=len(scopes)) as executor:
+            results = list(executor.map(lambda scope: self.list_runners(*scope), scopes))
+
+        available_runners: Dict[int, Dict] = {}
+        for runners in results:
+            for runner in runners:
+                available_runners.setdefault(runner['id'], runner)
+        return list(available_runners.values())
+
+    def list_runners(self, path: str, runner_type: str) -> List[Dict]:
+        """
+        Список активных раннеров по пути API (status=online, paused=false — отбор на стороне GitLab).
+        Число страниц берется из X-Total-Pages первого ответа, остальные страницы запрашиваются параллельно
+        """
+        url = f"{self.gitlab_url}/api/v4{path}"
+        params = {'type': runner_type, 'status': 'online', 'paused': 'false', 'per_page': 100}
 
-        while True:
-            response = requests.get(url, headers=self.headers, params={'per_page': 100, 'page': page})
+        def fetch_page(page: int):
+            response = self.session.get(url, headers=self.headers, params={**params, 'page': page})
             if response.status_code != 200:
                 raise Exception(f"GitLab API error: {response.status_code} - {response.text}")
-
-            data = response.json()
-            if not data:
-                break
-
+            return response.json(), response.headers
+
+        available_runners, headers = fetch_page(1)
+        total_pages = headers.get('X-Total-Pages')
+
+        if total_pages:
+            remaining = range(2, int(total_pages) + 1)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for data, _ in executor.map(fetch_page, remaining):
+                    available_runners.extend(data)
+            return available_runners
+
+        # Без X-Total-Pages (больше 10k записей) страницы обходятся по X-Next-Page
+        next_page = headers.get('X-Next-Page')
+        while next_page:
+            data, headers = fetch_page(int(next_page))
             available_runners.extend(data)
-            page += 1
+            next_page = headers.get('X-Next-Page')
 
         return available_runners
 
+    def get_runner_capacity(self, available_runners: List[Dict]) -> RunnerCapacityModel:
+        """Модель свободных слотов раннеров: лимит параллельности минус выполняемые задачи"""
+        return fetch_runner_capacity(self.session, self.gitlab_url, self.headers, available_runners,
+                                     self.runner_concurrency, self.default_runner_concurrency, self.max_workers)
+
+    def start_runner_registry(self, refresh_interval: float = 60) -> RunnerRegistry:
+        """Запуск фонового обновления состояния раннеров: цикл планирования читает его из памяти"""
+        self.runner_registry = RunnerRegistry(
+            lambda: self.get_runner_capacity(self.get_available_runners()).runners, refresh_interval)
+        self.runner_registry.start()
+        return self.runner_registry
+
+    def current_runner_capacity(self) -> RunnerCapacityModel:
+        """Модель емкости из фонового кэша, а без него — запросом к GitLab"""
+        if self.runner_registry is not None:
+            capacity = self.runner_registry.capacity()
+            if capacity is None and self.runner_registry.refresh():
+                capacity = self.runner_registry.capacity()
+            return capacity or RunnerCapacityModel([])
+        return self.get_runner_capacity(self.get_available_runners())
+
     def get_fuzzing_projects(self) -> List[ProjectInfo]:
-        result: List[ProjectInfo] = []
+        if self.discovery_backend is not None:
+            return self.discovery_backend.get_fuzzing_projects()
+
+        return self.enrich_projects(self.iter_project_stubs())
+
+    def iter_project_stubs(self, **filters) -> Iterator:
+        """
+        Ленивый обход проектов группы: keyset пагинация по id, упрощенное представление проектов
+        и отбор неархивных проектов на стороне GitLab. Страницы запрашиваются по мере продвижения,
+        поэтому стоимость листинга линейна, а в памяти находится одна страница.
+        :param filters: Дополнительные параметры листинга (например, last_activity_after)
+        """
         group = self.gl.groups.get(self.group_id, lazy=True)
-        all_projects = group.projects.list(include_subgroups=True, all=True)
+        return group.projects.list(include_subgroups=True, simple=True, archived=False,
+                                   pagination="keyset", order_by="id", sort="asc", per_page=100,
+                                   iterator=True, **filters)
+
+    def enrich_projects(self, project_stubs: Iterable) -> List[ProjectInfo]:
+        """Сбор информации о проектах в порядке project_stubs, недоступные проекты пропускаются"""
+        if self.max_workers == 1:
+            enriched = map(self.enrich_project, project_stubs)
+            return [p for p in enriched if p is not None]
+
+        # Обогащение выполняется параллельно с сохранением порядка листинга группы.
+        # Впереди обрабатываемого проекта запрошено не больше stream_depth заглушек
+        result: List[ProjectInfo] = []
+        stubs = iter(project_stubs)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque(executor.submit(self.enrich_project, stub) for stub in islice(stubs, self.stream_depth))
+            while pending:
+                project = pending.popleft().result()
+                if project is not None:
+                    result.append(project)
+                pending.extend(executor.submit(self.enrich_project, stub) for stub in islice(stubs, 1))
+        return result
+
+    def iter_fuzzing_projects(self) -> Iterator[ProjectInfo]:
+        """Потоковый аналог get_fuzzing_projects: проекты выдаются по мере готовности, в порядке завершения"""
+        if self.discovery_backend is not None:
+            yield from self.discovery_backend.get_fuzzing_projects()
+            return
+
+        for project in self.stream_map(self.enrich_project, self.iter_project_stubs()):
+            if project is not None:
+                yield project
 
-        for project_stub in all_projects:
+    def stream_map(self, func: Callable, items: Iterable) -> Iterator:
+        """
+        Параллельное применение func к items с выдачей результатов в порядке завершения.
+        В работе одновременно не больше stream_depth элементов: следующий элемент берется из items
+        только после выдачи предыдущего результата, поэтому память ограничена глубиной стадии.
+        """
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {executor.submit(func, item) for item in islice(items, self.stream_depth)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                    pending.update(executor.submit(func, item) for item in islice(items, 1))
+
+    def enrich_project(self, project_stub) -> Optional[ProjectInfo]:
+        """
+        Сбор информации о проекте из GitLab.
+        Возвращает None, если проект недоступен — остальные проекты обрабатываются независимо.
+        """
+        fields = listing_fields(project_stub)
+        if self.project_cache is not None:
             try:
-                project = self.gl.projects.get(project_stub.id)
-                default_branch = project.default_branch or "main"
-                main_branch_exists = True
-                has_gitlab_ci_file = False
-                last_modified = None
-                last_pipeline_run = None
-                pipeline_run_count = 0
-
-                # Проверка существования ветки
-                try:
-                    project.branches.get("main")
-                except gitlab.exceptions.GitlabGetError:
-                    main_branch_exists = False
-
-                # Проверка наличия .gitlab-ci.yml
-                if main_branch_exists:
-                    try:
-                        project.files.get(file_path=".gitlab-ci.yml", ref="main")
-                        has_gitlab_ci_file = True
-                    except gitlab.exceptions.GitlabGetError:
-                        pass
-
-                # Получение времени последнего коммита в main
-                if main_branch_exists:
-                    commits = project.commits.list(ref_name="main", per_page=1)
-                    if commits:
-                        last_modified = datetime.strptime(commits[0].committed_date, "%Y-%m-%dT%H:%M:%S.%f%z")
-
-                # Получение pipeline'ов
-                if main_branch_exists:
-                    pipelines = project.pipelines.list(ref="main", order_by="updated_at", sort="desc", per_page=1)
-                    pipeline_run_count = project.pipelines.list(ref="main", per_page=1).pagination['total'] \
-                        if hasattr(project.pipelines.list(ref="main", per_page=1), 'pagination') else 0
-
-                    if pipelines:
-                        last_pipeline_run = datetime.strptime(pipelines[0].updated_at, "%Y-%m-%dT%H:%M:%S.%f%z")
-
-                result.append(ProjectInfo(
-                    id=project.id,
-                    name=project.name,
-                    path_with_namespace=project.path_with_namespace,
-                    web_url=project.web_url,
-                    main_branch_exists=main_branch_exists,
-                    has_gitlab_ci_file=has_gitlab_ci_file,
-                    last_modified=last_modified,
-                    last_pipeline_run=last_pipeline_run,
-                    pipeline_run_count=pipeline_run_count,
-                    default_branch=default_branch,
-                    archived=project.archived
-                ))
+                return self.project_cache.enrich(project_stub.id, listing=fields)
+            except requests.RequestException as e:
+                print(f"[WARN] Не удалось получить данные проекта {project_stub.id}: {e}")
+                return None
 
+        try:
+            if fields is None:
+                project = self.gl.projects.get(project_stub.id)
+                fields = {field: getattr(project, field) for field in LISTING_FIELDS + ('archived',)}
+            else:
+                # Для запросов к ветке, файлам и пайплайнам достаточно lazy объекта без запроса проекта
+                project = self.gl.projects.get(project_stub.id, lazy=True)
+            default_branch = fields['default_branch'] or "main"
+            main_branch_exists = True
+            has_gitlab_ci_file = False
+            last_modified = None
+            last_pipeline_run = None
+            pipeline_run_count = 0
+
+            # Проверка существования ветки, ответ содержит и последний коммит в main
+            try:
+                branch = project.branches.get("main")
+                last_modified = parse_gitlab_datetime(branch.commit['committed_date'])
             except gitlab.exceptions.GitlabGetError:
-                continue
+                main_branch_exists = False
+
+            # Проверка наличия .gitlab-ci.yml
+            if main_branch_exists:
+                has_gitlab_ci_file = self.ci_file_probe.has_ci_file(project, branch.commit['id'])
+
+            # Получение pipeline'ов
+            if main_branch_exists:
+                summary = self.pipeline_summary.fetch(project)
+                last_pipeline_run = summary.last_pipeline_run
+                pipeline_run_count = summary.pipeline_run_count
+
+            return ProjectInfo(
+                id=project.id,
+                name=fields['name'],
+                path_with_namespace=fields['path_with_namespace'],
+                web_url=fields['web_url'],
+                main_branch_exists=main_branch_exists,
+                has_gitlab_ci_file=has_gitlab_ci_file,
+                last_modified=last_modified,
+                last_pipeline_run=last_pipeline_run,
+                pipeline_run_count=pipeline_run_count,
+                default_branch=default_branch,
+                archived=fields['archived'],
+                ci_blob_id=self.ci_file_probe.blob_id(project.id) if has_gitlab_ci_file else None
+            )
 
-        return result
+        except gitlab.exceptions.GitlabGetError:
+            return None
+        except gitlab.exceptions.GitlabHeadError as e:
+            print(f"[WARN] Не удалось проверить .gitlab-ci.yml проекта {project_stub.id}: {e}")
+            return None
 
     def project_ready(self, project: ProjectInfo) -> bool:
         """Проверка, готов ли проект к запуску пайплайна"""
         return project.main_branch_exists and project.has_gitlab_ci_file
 
-    def get_defect_count(self, project: Dict) -> int:
+    def get_defect_count(self, project: ProjectInfo) -> int:
         """
         Получение количества открытых дефектов из DefectDojo для проекта.
         Выполняется только если настроен API токен DefectDojo.
@@ -132,34 +501,72 @@ class FuzzingPipelineScheduler:
             # Пропускаем, если не задана интеграция
             return 0 
     
+        if self.defect_store is not None:
+            return self.defect_store.defect_count(project)
+
         try:
             headers = {
                 'Authorization': f'Token {self.defectdojo_token}',
                 'Content-Type': 'application/json',
             }
     
-            search_url = f"{self.defectdojo_url}/api/v2/products/?name={project['name']}"
-            response = requests.get(search_url, headers=headers, timeout=5)
-            response.raise_for_status()
-    
-            products = response.json().get('results', [])
-            
-            if not products:
-                return 0
-    
-            product_id = products[0]['id']
+            if self.product_index is not None:
+                product_id = self.product_index.product_id(project)
+                if product_id is None:
+                    return 0
+            else:
+                search_url = f"{self.defectdojo_url}/api/v2/products/?name={project.name}"
+                response = self.session.get(search_url, headers=headers, timeout=5)
+                response.raise_for_status()
+
+                products = response.json().get('results', [])
+
+                if not products:
+                    return 0
+
+                product_id = products[0]['id']
+
+            if self.defect_memo is not None:
+                cached = self.defect_memo.lookup(product_id)
+                if cached is not None:
+                    return cached
     
-            findings_url = f"{self.defectdojo_url}/api/v2/findings/?product={product_id}&active=true&verified=true&false_p=false&duplicate=false"
-            findings_response = requests.get(findings_url, headers=headers, timeout=5)
+            # limit=1: нужен только count — общее число подходящих находок, а не тела находок первой страницы
+            findings_url = f"{self.defectdojo_url}/api/v2/findings/?product={product_id}&active=true&verified=true&false_p=false&duplicate=false&limit=1"
+            findings_response = self.session.get(findings_url, headers=headers, timeout=5)
             findings_response.raise_for_status()
-    
-            findings = findings_response.json().get('results', [])
-            return len(findings)
+
+            count = findings_response.json().get('count', 0)
+            if self.defect_memo is not None:
+                self.defect_memo.store(product_id, count)
+            return count
     
         except requests.RequestException as e:
-            print(f"[WARN] Не удалось получить данные из DefectDojo для проекта {project['name']}: {e}")
+            print(f"[WARN] Не удалось получить данные из DefectDojo для проекта {project.name}: {e}")
             return 0
 
+    def invalidate_defect_count(self, project: ProjectInfo) -> None:
+        """
+        Сброс закэшированного числа дефектов проекта, например после завершения пайплайна фаззинга,
+        импортирующего результаты в DefectDojo. Без индекса продуктов сбрасывается весь кэш
+        """
+        if self.defect_memo is None:
+            return
+        product_id = self.product_index.product_id(project) if self.product_index is not None else None
+        if product_id is not None:
+            self.defect_memo.invalidate(product_id)
+        elif self.product_index is None:
+            self.defect_memo.invalidate()
+
+    def get_defect_factor(self, project: ProjectInfo) -> float:
+        """
+        Фактор дефектов для приоритета: при заданном defect_store — число находок, взвешенное
+        по severity_weights и defect_age_weights из предвычисленных счетчиков, иначе число открытых находок
+        """
+        if self.defect_store is not None and self.defectdojo_url and self.defectdojo_token:
+            return self.defect_store.weighted_defects(project, self.severity_weights, self.defect_age_weights)
+        return self.get_defect_count(project)
+
     def normalize(self, values: List[float]) -> List[float]:
         """Нормализация значений от 0 до 1"""
         if not values:
@@ -169,31 +576,39 @@ class FuzzingPipelineScheduler:
             return [0.5 for _ in values]
         return [(v - min_v) / (max_v - min_v) for v in values]
         
-    def prioritize_projects(self, projects):
-        now = datetime.utcnow()
-        filtered_projects = []
-        last_changes = []
-        run_counts = []
-        defect_counts = []
-
-        # Фильтрация и сбор данных
-        for p in projects:
-            if not self.project_ready(p):
-                continue
+    def is_candidate(self, project: ProjectInfo, now: datetime,
+                     capacity: Optional[RunnerCapacityModel] = None) -> bool:
+        """
+        Проект готов к запуску и не запускался в течение последних 24 часов.
+        Если передана модель емкости — свободных подходящих раннеров хватает на все задачи фаззинга проекта
+        (то же условие, что и при запуске в run_pipelines)
+        """
+        if not self.project_ready(project):
+            return False
 
-            if p.last_pipeline_run and now - p.last_pipeline_run < timedelta(hours=24):
-                continue
+        if project.last_pipeline_run and now - project.last_pipeline_run < timedelta(hours=24):
+            return False
 
-            defect_count = self.get_defect_count(p)
+        if capacity is not None and not capacity.can_reserve_all(self.job_tags.job_tag_sets(project), project.id):
+            return False
 
-            filtered_projects.append(p)
-            last_changes.append((now - p.last_modified).total_seconds())
-            run_counts.append(p.pipeline_run_count)
-            defect_counts.append(defect_count)
+        return True
+
+    def filter_candidates(self, projects: Iterable[ProjectInfo],
+                          capacity: Optional[RunnerCapacityModel] = None) -> List[ProjectInfo]:
+        """Отбор проектов, готовых к запуску и не запускавшихся в течение последних 24 часов"""
+        now = datetime.now(timezone.utc)
+        return [p for p in projects if self.is_candidate(p, now, capacity)]
 
-        if not filtered_projects:
+    def rank_projects(self, projects: List[ProjectInfo], defect_counts: List[float]) -> List[ProjectInfo]:
+        """Расчет приоритета для отобранных проектов и сортировка по его убыванию"""
+        if not projects:
             return []
 
+        now = datetime.now(timezone.utc)
+        last_changes = [(now - p.last_modified).total_seconds() if p.last_modified else 0.0 for p in projects]
+        run_counts = [p.pipeline_run_count for p in projects]
+
         # Нормализация: чем выше значение — тем выше приоритет
         norm_last_change = self.normalize(last_changes)
         norm_runs_count = [1 - x for x in self.normalize(run_counts)]  # меньше запусков — выше приоритет 
@@ -201,7 +616,7 @@ class FuzzingPipelineScheduler:
 
         # Расчет итогового приоритета
         scored_projects = []
-        for i, p in enumerate(filtered_projects):
+        for i, p in enumerate(projects):
             score = (
                 norm_last_change[i] * self.weights['last_change'] +
                 norm_runs_count[i] * self.weights['runs_count'] +
@@ -213,32 +628,149 @@ class FuzzingPipelineScheduler:
         scored_projects.sort(reverse=True, key=lambda x: x[0])
         return [p for _, p in scored_projects]
 
+    def prioritize_projects(self, projects: List[ProjectInfo],
+                            capacity: Optional[RunnerCapacityModel] = None) -> List[ProjectInfo]:
+        candidates = self.filter_candidates(projects, capacity)
+        defect_counts = [self.get_defect_factor(p) for p in candidates]
+        return self.rank_projects(candidates, defect_counts)
+
+    def stream_candidates(self, projects: Iterable[ProjectInfo],
+                          capacity: Optional[RunnerCapacityModel] = None) -> Iterator[Tuple[ProjectInfo, float]]:
+        """
+        Потоковый отбор: проекты фильтруются по мере поступления, а запрос дефектов
+        для каждого прошедшего фильтр проекта запускается сразу же
+        """
+        now = datetime.now(timezone.utc)
+        candidates = (p for p in projects if self.is_candidate(p, now, capacity))
+        return self.stream_map(lambda p: (p, self.get_defect_factor(p)), candidates)
+
+    def prioritize_projects_streaming(self, capacity: Optional[RunnerCapacityModel] = None) -> List[ProjectInfo]:
+        """Приоритизация в потоковом режиме: сбор проектов, фильтрация и запросы дефектов идут одновременно"""
+        candidates, defect_counts = [], []
+        for project, defect_count in self.stream_candidates(self.iter_fuzzing_projects(), capacity):
+            candidates.append(project)
+            defect_counts.append(defect_count)
+        return self.rank_projects(candidates, defect_counts)
+
+
+    def record_pipeline_started(self, project_id: int, pipeline_id: int) -> None:
+        """Запись запущенного пайплайна в кэш фактов, чтобы следующий цикл учитывал 24-часовую паузу"""
+        if self.project_cache is not None:
+            self.project_cache.record_pipeline(project_id, pipeline_id, datetime.now(timezone.utc))
+
+    def run_pipelines(self, projects: List[ProjectInfo], capacity: RunnerCapacityModel) -> List[ProjectInfo]:
+        """
+        Запуск пайплайнов на ветке main в порядке приоритета — ровно столько, сколько раннеры
+        могут начать немедленно, чтобы пайплайны не ждали в pending: для каждой задачи фаззинга
+        пайплайна занимается свой слот
+        """
+        started = []
+        for project in projects:
+            if capacity.total_free_slots() == 0:
+                break
+            reserved = capacity.reserve_all(self.job_tags.job_tag_sets(project), project.id)
+            if reserved is None:
+                continue
+
+            try:
+                pipeline = self.gl.projects.get(project.id, lazy=True).pipelines.create({'ref': 'main'})
+                started.append(project)
+                self.record_pipeline_started(project.id, pipeline.id)
+            except gitlab.exceptions.GitlabCreateError as e:
+                capacity.release(reserved)
+                print(f"[WARN] Не удалось запустить пайплайн для проекта {project.path_with_namespace}: {e}")
+
+        return started
+
+    def record_utilization(self, free_slots: int, capacity: RunnerCapacityModel,
+                           backlog: Optional[List[ProjectInfo]]) -> None:
+        """
+        Запись загрузки раннеров за цикл и план запуска отложенных проектов по прогнозу емкости
+        :param free_slots: Свободные слоты в начале цикла
+        :param backlog: Готовые к запуску проекты, на которые не хватило слотов (None — не определялись)
+        """
+        if self.utilization_store is None:
+            return
+        running_fuzz_jobs = sum(r.running_fuzz_jobs for r in capacity.runners)
+        self.utilization_store.record(free_slots, running_fuzz_jobs, None if backlog is None else len(backlog))
+
+        forecast = self.utilization_store.forecast(self.forecast_horizon, self.cycle_interval)
+        self.dispatch_plan = plan_dispatches(backlog or [], forecast)
+        for at, projects in self.dispatch_plan:
+            print(f"Ожидается свободная емкость в {at.astimezone():%H:%M}: "
+                  f"{', '.join(p.path_with_namespace for p in projects)}")
+
+    def next_cycle_delay(self) -> float:
+        """
+        Пауза до следующего цикла: при отложенных проектах — до первого окна, где по прогнозу
+        освободятся слоты (но не меньше min_cycle_delay), иначе cycle_interval
+        """
+        if self.dispatch_plan:
+            at = self.dispatch_plan[0][0]
+            return max(self.min_cycle_delay.total_seconds(), (at - datetime.now(timezone.utc)).total_seconds())
+        return self.cycle_interval.total_seconds()
+
+    def run_forever(self, stop: Optional[Event] = None) -> None:
+        """Циклическое планирование с паузами по прогнозу емкости раннеров"""
+        stop = stop or Event()
+        while not stop.is_set():
+            try:
+                self.schedule_pipelines()
+                delay = self.next_cycle_delay()
+            except Exception as e:
+                print(f"[WARN] Ошибка цикла планирования: {e}")
+                # Например, GitLab недоступен: повтор не раньше, чем через cycle_interval
+                delay = self.cycle_interval.total_seconds()
+            stop.wait(delay)
 
     def schedule_pipelines(self) -> None:
         print("Планирование запусков пайплайнов...")
+        # План предыдущего цикла устарел; если цикл завершится до record_utilization, пауза будет cycle_interval
+        self.dispatch_plan = []
 
         # Шаг 1: Проверка доступности раннеров
-        available_runners = self.get_available_runners()
-        if not available_runners:
+        capacity = self.current_runner_capacity()
+        if not capacity.runners:
             print("Нет доступных раннеров. Пропуск цикла планирования.")
             return
 
-        # Шаг 2: Получение проектов
-        projects = self.get_fuzzing_projects()
-        if not projects:
-            print("Нет доступных проектов в группе.")
+        free_slots = capacity.total_free_slots()
+        if free_slots == 0:
+            print("Нет свободных слотов у раннеров. Пропуск цикла планирования.")
+            self.record_utilization(free_slots, capacity, None)
             return
 
-        # Шаг 3: Приоритезация проектов
-        prioritized_projects = self.prioritize_projects(projects)
+        if self.defect_store is not None:
+            # Находки DefectDojo синхронизируются одновременно со сбором проектов GitLab
+            self.defect_store.start_sync()
+        if self.defect_memo is not None:
+            self.defect_memo.check_imports()
+
+        if self.streaming:
+            # Шаги 2-3 в потоковом режиме выполняются одновременно
+            prioritized_projects = self.prioritize_projects_streaming(capacity)
+        else:
+            # Шаг 2: Получение проектов
+            projects = self.get_fuzzing_projects()
+            if not projects:
+                print("Нет доступных проектов в группе.")
+                return
+
+            # Шаг 3: Приоритезация проектов
+            prioritized_projects = self.prioritize_projects(projects, capacity)
+
         if not prioritized_projects:
             print("Нет проектов, удовлетворяющих условиям для запуска.")
+            self.record_utilization(free_slots, capacity, [])
             return
 
         # Шаг 4: Запуск пайплайнов
-        # self.run_pipelines(prioritized_projects, available_runners)
+        started = self.run_pipelines(prioritized_projects, capacity)
+
+        print(f"Планирование завершено, запущено пайплайнов: {len(started)}")
 
-        print("Планирование завершено (логика приоритезации будет реализована в следующей версии)")
+        started_ids = {p.id for p in started}
+        self.record_utilization(free_slots, capacity, [p for p in prioritized_projects if p.id not in started_ids])
 
 if __name__ == "__main__":
     GITLAB_URL = "https://gitlab.example.com"
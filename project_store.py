@@ -0,0 +1,389 @@
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import requests
+
+from main import FuzzingPipelineScheduler, ProjectInfo, parse_gitlab_datetime
+
+# Время жизни закэшированных фактов в секундах. 0 — факт перепроверяется каждый цикл
+# (условным запросом, поэтому неизмененный ресурс стоит только ответа 304)
+DEFAULT_FACT_TTLS = {
+    'project': 24 * 3600,      # имя, путь, ветка по умолчанию, признак архивации
+    'main_branch': 0,          # существование main и дата последнего коммита
+    'ci_file': 6 * 3600,       # наличие .gitlab-ci.yml (перепроверяется и при смене головного коммита main)
+    'pipelines': 0,            # последний пайплайн (число запусков — в факте pipeline_counter трекера)
+}
+
+
+@dataclass
+class CachedFact:
+    value: Any
+    fetched_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class ProjectStore:
+    """
+    Постоянное хранилище фактов о проектах в SQLite.
+    Для каждого факта хранится время получения и ETag/Last-Modified ответа, из которого он получен.
+    """
+
+    def __init__(self, path: str = "scheduler_cache.sqlite3"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS facts ("
+                " project_id INTEGER NOT NULL,"
+                " fact TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " etag TEXT,"
+                " last_modified TEXT,"
+                " PRIMARY KEY (project_id, fact))"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get_fact(self, project_id: int, fact: str) -> Optional[CachedFact]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, fetched_at, etag, last_modified FROM facts WHERE project_id = ? AND fact = ?",
+                (project_id, fact)
+            ).fetchone()
+        if row is None:
+            return None
+        return CachedFact(value=json.loads(row[0]), fetched_at=row[1], etag=row[2], last_modified=row[3])
+
+    def put_fact(self, project_id: int, fact: str, value: Any,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO facts (project_id, fact, value, fetched_at, etag, last_modified)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (project_id, fact, json.dumps(value), time.time(), etag, last_modified)
+            )
+
+    def touch_fact(self, project_id: int, fact: str) -> None:
+        """Продление факта после ответа 304"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE facts SET fetched_at = ? WHERE project_id = ? AND fact = ?",
+                               (time.time(), project_id, fact))
+
+    def invalidate(self, project_id: Optional[int] = None, fact: Optional[str] = None) -> None:
+        """Сброс времени получения: факты будут перепроверены при следующем обращении"""
+        query, params = "UPDATE facts SET fetched_at = 0", []
+        conditions = []
+        if project_id is not None:
+            conditions.append("project_id = ?")
+            params.append(project_id)
+        if fact is not None:
+            conditions.append("fact = ?")
+            params.append(fact)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock, self._conn:
+            self._conn.execute(query, params)
+
+    def delete_project(self, project_id: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM facts WHERE project_id = ?", (project_id,))
+
+    def project_ids(self) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT project_id FROM facts").fetchall()
+        return [row[0] for row in rows]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def dump_datetime(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def load_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class CachedProjectEnricher:
+    """
+    Сбор ProjectInfo с использованием ProjectStore.
+    Свежие по TTL факты берутся из хранилища без запросов, устаревшие перепроверяются условными
+    запросами (If-None-Match / If-Modified-Since).
+    """
+
+    def __init__(self, scheduler: FuzzingPipelineScheduler, store: ProjectStore,
+                 ttls: Optional[Dict[str, float]] = None, force_refresh: bool = False, timeout: float = 30):
+        """
+        :param ttls: Переопределение DEFAULT_FACT_TTLS
+        :param force_refresh: Игнорировать TTL и ETag, полностью обновив все факты
+        """
+        self.scheduler = scheduler
+        self.store = store
+        self.ttls = {**DEFAULT_FACT_TTLS, **(ttls or {})}
+        self.force_refresh = force_refresh
+        self.timeout = timeout
+        self.session = scheduler.session
+        if scheduler.pipeline_summary.store is None:
+            # Счетчики пайплайнов хранятся вместе с остальными фактами
+            scheduler.pipeline_summary.store = store
+
+    def enrich(self, project_id: int, listing: Optional[Dict] = None) -> Optional[ProjectInfo]:
+        """
+        :param listing: Метаданные проекта из листинга группы (main.listing_fields); при их наличии
+                        факт 'project' обновляется без запроса проекта
+        """
+        base = f"{self.scheduler.gitlab_url}/api/v4/projects/{project_id}"
+
+        if listing is not None:
+            self.store.put_fact(project_id, 'project', listing)
+            project = listing
+        else:
+            project = self._fact(project_id, 'project', base, None, self._parse_project)
+        if project is None:
+            # Проект удален или недоступен
+            self.store.delete_project(project_id)
+            return None
+
+        main_branch = self._fact(project_id, 'main_branch', f"{base}/repository/branches/main", None,
+                                 self._parse_main_branch) or {'exists': False, 'last_modified': None}
+        ci_file = None
+        pipelines = {'last_pipeline_run': None}
+
+        if main_branch['exists']:
+            ci_file = self._ci_file(project_id, base, main_branch.get('commit_sha'))
+
+            tracker = self.scheduler.pipeline_summary
+            pipelines_url = f"{base}/pipelines"
+            # Без известного счетчика ответ 304 не даст числа запусков, поэтому запрос полный
+            pipelines = self._fact(project_id, 'pipelines', pipelines_url,
+                                   {'ref': 'main', 'order_by': 'id', 'sort': 'desc', 'per_page': tracker.page_size},
+                                   lambda response: self._parse_pipelines(project_id, response, pipelines_url),
+                                   refresh=tracker.known(project_id) is None) or pipelines
+
+        return self._build_project_info(project_id, project, main_branch, ci_file, pipelines)
+
+    def _ci_file(self, project_id: int, base: str, head_sha: Optional[str]) -> Optional[Dict]:
+        """
+        Наличие .gitlab-ci.yml по HEAD запросу, без загрузки содержимого файла.
+        Результат привязан к SHA головного коммита main: пока ветка не сдвинулась, запросов нет.
+        """
+        cached = None if self.force_refresh else self.store.get_fact(project_id, 'ci_file')
+        if cached is not None and cached.fetched_at > 0 and (
+                (head_sha and cached.value is not None and cached.value.get('commit_sha') == head_sha)
+                or (not head_sha and time.time() - cached.fetched_at < self.ttls['ci_file'])):
+            return cached.value
+
+        response = self.session.head(f"{base}/repository/files/{quote('.gitlab-ci.yml', safe='')}",
+                                     headers=self.scheduler.headers, params={'ref': head_sha or 'main'},
+                                     timeout=self.timeout)
+        if response.status_code == 404:
+            value = {'exists': False, 'commit_sha': head_sha, 'blob_id': None}
+        else:
+            response.raise_for_status()
+            value = {'exists': True, 'commit_sha': head_sha, 'blob_id': response.headers.get('X-Gitlab-Blob-Id')}
+
+        self.store.put_fact(project_id, 'ci_file', value)
+        return value
+
+    def record_pipeline(self, project_id: int, pipeline_id: int, created_at: datetime) -> None:
+        """
+        Учет пайплайна, запущенного планировщиком. Создание пайплайна не сдвигает last_activity_at,
+        поэтому инкрементальный сбор не перечитает факт 'pipelines' до полного обхода
+        """
+        tracker = self.scheduler.pipeline_summary
+        # Неизвестный счетчик не создается: число запусков определит следующий запрос пайплайнов
+        if tracker.known(project_id) is not None:
+            tracker.update(project_id, [(pipeline_id, None)], None)
+        # Без ETag: следующая проверка факта будет полным запросом
+        self.store.put_fact(project_id, 'pipelines', {'last_pipeline_run': dump_datetime(created_at)})
+
+    def load(self, project_id: int) -> Optional[ProjectInfo]:
+        """Сборка ProjectInfo только из хранилища, без запросов в GitLab"""
+        project = self.store.get_fact(project_id, 'project')
+        if project is None or project.value is None:
+            return None
+
+        main_branch = self.store.get_fact(project_id, 'main_branch')
+        main_branch = main_branch.value if main_branch and main_branch.value else {'exists': False,
+                                                                                   'last_modified': None}
+        ci_file = self.store.get_fact(project_id, 'ci_file')
+        pipelines = self.store.get_fact(project_id, 'pipelines')
+        pipelines = pipelines.value if pipelines and pipelines.value else {'last_pipeline_run': None}
+
+        return self._build_project_info(project_id, project.value, main_branch,
+                                        ci_file.value if ci_file else None, pipelines)
+
+    def _build_project_info(self, project_id: int, project: Dict, main_branch: Dict, ci_file: Optional[Dict],
+                            pipelines: Dict) -> ProjectInfo:
+        """Число запусков берется из счетчика PipelineSummaryTracker — единственной его копии"""
+        has_gitlab_ci_file = bool(ci_file and ci_file['exists'])
+        return ProjectInfo(
+            id=project_id,
+            name=project['name'],
+            path_with_namespace=project['path_with_namespace'],
+            web_url=project['web_url'],
+            main_branch_exists=main_branch['exists'],
+            has_gitlab_ci_file=has_gitlab_ci_file,
+            last_modified=load_datetime(main_branch['last_modified']),
+            last_pipeline_run=load_datetime(pipelines['last_pipeline_run']),
+            pipeline_run_count=self.scheduler.pipeline_summary.pipeline_run_count(project_id)
+            if main_branch['exists'] else 0,
+            default_branch=project['default_branch'] or "main",
+            archived=project['archived'],
+            ci_blob_id=ci_file.get('blob_id') if has_gitlab_ci_file else None
+        )
+
+    def _fact(self, project_id: int, fact: str, url: str, params: Optional[Dict], parse,
+              refresh: bool = False) -> Optional[Dict]:
+        """
+        Получение факта из хранилища или из GitLab.
+        Ответ 404/403 означает отсутствие ресурса и сохраняется как None.
+        :param refresh: Запросить факт без условных заголовков, как при force_refresh
+        """
+        cached = None if self.force_refresh or refresh else self.store.get_fact(project_id, fact)
+        if cached is not None and time.time() - cached.fetched_at < self.ttls[fact]:
+            return cached.value
+
+        headers = dict(self.scheduler.headers)
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached is not None and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
+
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            self.store.touch_fact(project_id, fact)
+            return cached.value
+        if response.status_code in (403, 404):
+            self.store.put_fact(project_id, fact, None)
+            return None
+        response.raise_for_status()
+
+        value = parse(response)
+        self.store.put_fact(project_id, fact, value,
+                            etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+        return value
+
+    def _get_json(self, url: str, params: Dict) -> Any:
+        response = self.session.get(url, params=params, headers=self.scheduler.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _parse_project(response: requests.Response) -> Dict:
+        data = response.json()
+        return {
+            'name': data['name'],
+            'path_with_namespace': data['path_with_namespace'],
+            'web_url': data['web_url'],
+            'default_branch': data.get('default_branch'),
+            'archived': data.get('archived', False),
+        }
+
+    @staticmethod
+    def _parse_main_branch(response: requests.Response) -> Dict:
+        commit = response.json().get('commit') or {}
+        return {
+            'exists': True,
+            'commit_sha': commit.get('id'),
+            'last_modified': dump_datetime(parse_gitlab_datetime(commit.get('committed_date'))),
+        }
+
+    def _parse_pipelines(self, project_id: int, response: requests.Response, url: str) -> Dict:
+        tracker = self.scheduler.pipeline_summary
+        page = [(p['id'], p['updated_at']) for p in response.json()]
+        total = response.headers.get('X-Total')
+        if tracker.needs_seed(project_id, page, total):
+            params = {'ref': 'main', 'per_page': tracker.page_size}
+            total = tracker.count_pages(lambda n: len(self._get_json(url, {**params, 'page': n})))
+        summary = tracker.update(project_id, page, total)
+        # Счетчик сохраняется самим трекером (факт pipeline_counter), здесь только время последнего запуска
+        return {'last_pipeline_run': dump_datetime(summary.last_pipeline_run)}
+
+
+class IncrementalProjectDiscovery:
+    """
+    Инкрементальный сбор проектов группы.
+    Запрашиваются только проекты с активностью после водяного знака прошлого успешного цикла
+    (last_activity_after), остальные собираются из ProjectStore. Периодический полный обход
+    находит удаленные и перенесенные проекты.
+    Сборка ProjectInfo идет через scheduler.enrich_projects, поэтому enricher должен быть
+    установлен как scheduler.project_cache.
+    """
+
+    WATERMARK_KEY = 'discovery_watermark'
+    FULL_SWEEP_KEY = 'discovery_full_sweep'
+
+    def __init__(self, scheduler: FuzzingPipelineScheduler, enricher: CachedProjectEnricher,
+                 full_sweep_interval: timedelta = timedelta(hours=24), overlap: timedelta = timedelta(hours=1)):
+        """
+        :param full_sweep_interval: Период полного обхода группы
+        :param overlap: Запас для водяного знака: GitLab обновляет last_activity_at с задержкой
+        """
+        self.scheduler = scheduler
+        self.enricher = enricher
+        self.store = enricher.store
+        self.full_sweep_interval = full_sweep_interval
+        self.overlap = overlap
+
+    def get_fuzzing_projects(self) -> List[ProjectInfo]:
+        cycle_started = datetime.now(timezone.utc)
+        watermark = load_datetime(self.store.get_meta(self.WATERMARK_KEY))
+        last_full_sweep = load_datetime(self.store.get_meta(self.FULL_SWEEP_KEY))
+
+        if watermark is None or last_full_sweep is None or cycle_started - last_full_sweep >= self.full_sweep_interval:
+            result = self._full_sweep()
+            self.store.set_meta(self.FULL_SWEEP_KEY, dump_datetime(cycle_started))
+        else:
+            result = self._incremental(watermark - self.overlap)
+
+        self.store.set_meta(self.WATERMARK_KEY, dump_datetime(cycle_started))
+        return result
+
+    def _full_sweep(self) -> List[ProjectInfo]:
+        listed_ids = set()
+
+        def stubs():
+            for stub in self.scheduler.iter_project_stubs():
+                listed_ids.add(stub.id)
+                yield stub
+
+        result = self.scheduler.enrich_projects(stubs())
+        # Проекты, пропавшие из листинга (удалены, перенесены или архивированы), убираются из хранилища
+        for project_id in self.store.project_ids():
+            if project_id not in listed_ids:
+                self.store.delete_project(project_id)
+        return sorted(result, key=lambda p: p.id)
+
+    def _incremental(self, since: datetime) -> List[ProjectInfo]:
+        changed = list(self.scheduler.iter_project_stubs(last_activity_after=since.isoformat()))
+        for stub in changed:
+            # Сохраняем ETag, чтобы неизмененные ресурсы перепроверялись ответом 304
+            self.store.invalidate(project_id=stub.id)
+
+        projects = {p.id: p for p in self.scheduler.enrich_projects(changed)}
+        changed_ids = {stub.id for stub in changed}
+        for project_id in self.store.project_ids():
+            if project_id not in changed_ids:
+                project = self.enricher.load(project_id)
+                if project is not None:
+                    projects[project_id] = project
+
+        return [projects[project_id] for project_id in sorted(projects)]
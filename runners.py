@@ -0,0 +1,386 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import requests
+import yaml
+
+
+@dataclass
+class RunnerCapacity:
+    id: int
+    description: str
+    tags: FrozenSet[str]
+    run_untagged: bool
+    online: bool
+    paused: bool
+    concurrency: int
+    running_jobs: int
+    runner_type: str = "group_type"
+    # Для раннеров проектов — проекты, которым раннер назначен
+    project_ids: FrozenSet[int] = frozenset()
+    # Из running_jobs — задачи фаззинга (по имени задачи)
+    running_fuzz_jobs: int = 0
+
+    @property
+    def free_slots(self) -> int:
+        """Число задач, которые раннер может взять немедленно"""
+        if not self.online or self.paused:
+            return 0
+        return max(0, self.concurrency - self.running_jobs)
+
+
+class RunnerTagIndex:
+    """
+    Индекс раннеров по тегам на битовых масках: бит i соответствует раннеру runners[i].
+    Подходящие для задачи раннеры — пересечение масок ее тегов, без перебора раннеров.
+    """
+
+    def __init__(self, runners: List[RunnerCapacity]):
+        self.all_mask = (1 << len(runners)) - 1
+        self.untagged_mask = 0
+        self.tag_masks: Dict[str, int] = {}
+        # Раннеры инстанса и группы доступны всем проектам, раннеры проектов — только своим
+        self.shared_mask = 0
+        self.project_masks: Dict[int, int] = {}
+        for i, runner in enumerate(runners):
+            if runner.run_untagged:
+                self.untagged_mask |= 1 << i
+            for tag in runner.tags:
+                self.tag_masks[tag] = self.tag_masks.get(tag, 0) | (1 << i)
+            if runner.runner_type == 'project_type':
+                for project_id in runner.project_ids:
+                    self.project_masks[project_id] = self.project_masks.get(project_id, 0) | (1 << i)
+            else:
+                self.shared_mask |= 1 << i
+
+    def project_pool(self, project_id: Optional[int]) -> int:
+        """Маска раннеров, доступных проекту (None — проект не учитывается)"""
+        if project_id is None:
+            return self.all_mask
+        return self.shared_mask | self.project_masks.get(project_id, 0)
+
+    def eligible(self, required_tags: Optional[FrozenSet[str]]) -> int:
+        """
+        Маска раннеров, которые могут взять задачу с тегами required_tags.
+        None — теги неизвестны, подходит любой раннер; пустой набор — нужен run_untagged
+        """
+        if required_tags is None:
+            return self.all_mask
+        if not required_tags:
+            return self.untagged_mask
+        mask = self.all_mask
+        for tag in required_tags:
+            mask &= self.tag_masks.get(tag, 0)
+        return mask
+
+
+class RunnerCapacityModel:
+    """
+    Модель емкости раннеров: свободные слоты по раннерам и по наборам тегов.
+    reserve() учитывает слоты, занятые запущенными в текущем цикле пайплайнами.
+    """
+
+    def __init__(self, runners: List[RunnerCapacity]):
+        self.runners = runners
+        self.tag_index = RunnerTagIndex(runners)
+        self._reserved: Dict[int, int] = {}
+        self._eligible_cache: Dict[Optional[FrozenSet[str]], int] = {}
+        # Пул раннеров проекта вычисляется один раз за цикл
+        self._pool_cache: Dict[Optional[int], int] = {}
+        # Маска раннеров со свободными слотами, обновляется при резервировании
+        self.free_mask = 0
+        self._positions: Dict[int, int] = {}
+        for i, runner in enumerate(runners):
+            self._positions[runner.id] = i
+            if runner.free_slots > 0:
+                self.free_mask |= 1 << i
+
+    def free_slots(self, runner: RunnerCapacity) -> int:
+        return max(0, runner.free_slots - self._reserved.get(runner.id, 0))
+
+    def total_free_slots(self) -> int:
+        return sum(self.free_slots(r) for r in self.runners)
+
+    def free_slots_by_runner(self) -> Dict[int, int]:
+        return {r.id: self.free_slots(r) for r in self.runners}
+
+    def free_slots_by_tags(self) -> Dict[FrozenSet[str], int]:
+        result: Dict[FrozenSet[str], int] = {}
+        for runner in self.runners:
+            result[runner.tags] = result.get(runner.tags, 0) + self.free_slots(runner)
+        return result
+
+    def eligible_pool(self, project_id: Optional[int]) -> int:
+        pool = self._pool_cache.get(project_id)
+        if pool is None:
+            pool = self._pool_cache[project_id] = self.tag_index.project_pool(project_id)
+        return pool
+
+    def _free_eligible(self, required_tags: Optional[FrozenSet[str]], project_id: Optional[int]) -> int:
+        eligible = self._eligible_cache.get(required_tags)
+        if eligible is None:
+            eligible = self._eligible_cache[required_tags] = self.tag_index.eligible(required_tags)
+        return eligible & self.eligible_pool(project_id) & self.free_mask
+
+    def has_free_runner(self, required_tags: Optional[FrozenSet[str]] = None, project_id: Optional[int] = None) -> bool:
+        return self._free_eligible(required_tags, project_id) != 0
+
+    def reserve(self, required_tags: Optional[FrozenSet[str]] = None,
+                project_id: Optional[int] = None) -> Optional[RunnerCapacity]:
+        """
+        Занять слот на раннере, подходящем под теги задачи (задача без тегов требует run_untagged)
+        и доступном проекту project_id. required_tags=None — теги задачи неизвестны, подходит любой раннер.
+        Возвращает раннер или None, если свободных подходящих слотов нет
+        """
+        return self._reserve_mask(self._free_eligible(required_tags, project_id))
+
+    def reserve_all(self, tag_sets: Optional[FrozenSet[FrozenSet[str]]] = None,
+                    project_id: Optional[int] = None) -> Optional[List[RunnerCapacity]]:
+        """
+        Занять по слоту для каждой задачи фаззинга пайплайна (по набору тегов из tag_sets): пайплайн
+        запускается, только если все его задачи могут начаться немедленно. tag_sets=None — задачи неизвестны,
+        занимается один слот на любом раннере. Возвращает занятые раннеры или None — тогда частичные
+        резервирования отменяются
+        """
+        reserved: List[RunnerCapacity] = []
+        # Наборы с меньшим числом подходящих раннеров занимаются первыми, чтобы не отдать их слоты другим задачам
+        ordered = [None] if tag_sets is None else sorted(
+            tag_sets, key=lambda tags: bin(self._free_eligible(tags, project_id)).count('1'))
+        for required_tags in ordered:
+            runner = self.reserve(required_tags, project_id)
+            if runner is None:
+                self.release(reserved)
+                return None
+            reserved.append(runner)
+        return reserved
+
+    def can_reserve_all(self, tag_sets: Optional[FrozenSet[FrozenSet[str]]] = None,
+                        project_id: Optional[int] = None) -> bool:
+        """Хватит ли свободных слотов на все задачи фаззинга пайплайна (пробное резервирование без изменения модели)"""
+        reserved = self.reserve_all(tag_sets, project_id)
+        if reserved is None:
+            return False
+        self.release(reserved)
+        return True
+
+    def release(self, runners: List[RunnerCapacity]) -> None:
+        """Отмена резервирований, например если пайплайн не удалось создать"""
+        for runner in runners:
+            self._reserved[runner.id] -= 1
+            if self.free_slots(runner) > 0:
+                self.free_mask |= 1 << self._positions[runner.id]
+
+    def _reserve_mask(self, mask: int) -> Optional[RunnerCapacity]:
+        if not mask:
+            return None
+
+        # Младший установленный бит — первый подходящий раннер
+        i = (mask & -mask).bit_length() - 1
+        runner = self.runners[i]
+        self._reserved[runner.id] = self._reserved.get(runner.id, 0) + 1
+        if self.free_slots(runner) == 0:
+            self.free_mask &= ~(1 << i)
+        return runner
+
+
+class RunnerRegistry:
+    """
+    Кэш состояния раннеров с фоновым обновлением раз в refresh_interval секунд.
+    Чтение идет из памяти; при ошибке API остается последний успешный снимок (stale-while-revalidate),
+    поэтому сбой GitLab не прерывает цикл планирования.
+    """
+
+    def __init__(self, fetch: Callable[[], List[RunnerCapacity]], refresh_interval: float = 60):
+        """
+        :param fetch: Получение актуального состояния раннеров (например, через get_runner_capacity)
+        """
+        self.fetch = fetch
+        self.refresh_interval = refresh_interval
+        self.runners: Optional[List[RunnerCapacity]] = None
+        self.updated_at: Optional[float] = None
+        self.last_error: Optional[Exception] = None
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def refresh(self) -> bool:
+        try:
+            runners = self.fetch()
+        except Exception as e:
+            self.last_error = e
+            if self.updated_at is None:
+                print(f"[WARN] Не удалось получить состояние раннеров: {e}")
+            else:
+                print(f"[WARN] Не удалось обновить состояние раннеров, используется снимок "
+                      f"{self.age():.0f} с назад: {e}")
+            return False
+
+        with self._lock:
+            self.runners = runners
+            self.updated_at = time.monotonic()
+            self.last_error = None
+        return True
+
+    def age(self) -> Optional[float]:
+        return time.monotonic() - self.updated_at if self.updated_at is not None else None
+
+    def capacity(self) -> Optional[RunnerCapacityModel]:
+        """
+        Новая модель емкости по последнему снимку (резервирования в ней не влияют на снимок).
+        None, если снимок еще ни разу не был получен
+        """
+        with self._lock:
+            runners = self.runners
+        return RunnerCapacityModel(list(runners)) if runners is not None else None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.refresh_interval)
+
+
+def runner_capacity_from_api(details: Dict, running_jobs: int, concurrency: int,
+                             running_fuzz_jobs: int = 0) -> RunnerCapacity:
+    """
+    :param details: Ответ GET /runners/:id
+    :param running_jobs: Число задач в статусе running (GET /runners/:id/jobs?status=running)
+    :param concurrency: Лимит одновременных задач раннера (concurrent/limit из config.toml, в API не отдается)
+    :param running_fuzz_jobs: Сколько из выполняемых задач — задачи фаззинга
+    """
+    return RunnerCapacity(
+        id=details['id'],
+        description=details.get('description') or "",
+        tags=frozenset(details.get('tag_list') or []),
+        run_untagged=details.get('run_untagged', True),
+        online=details.get('online', details.get('status') == 'online'),
+        paused=details.get('paused', not details.get('active', True)),
+        concurrency=concurrency,
+        running_jobs=running_jobs,
+        runner_type=details.get('runner_type') or "group_type",
+        project_ids=frozenset(p['id'] for p in details.get('projects') or []),
+        running_fuzz_jobs=running_fuzz_jobs,
+    )
+
+
+def count_fuzz_jobs(jobs: List[Dict], job_keyword: str = "fuzz") -> int:
+    """Число задач фаззинга в ответе /runners/:id/jobs (по имени или стадии задачи)"""
+    return sum(1 for job in jobs
+               if job_keyword in (job.get('name') or "").lower() or job_keyword in (job.get('stage') or "").lower())
+
+
+def fetch_runner_capacity(session, gitlab_url: str, headers: Dict[str, str], runners: List[Dict],
+                          concurrency: Dict[int, int], default_concurrency: int = 1,
+                          max_workers: int = 8) -> RunnerCapacityModel:
+    """
+    Сбор модели емкости: детали раннера и число выполняемых задач запрашиваются параллельно для всех раннеров
+    :param runners: Раннеры из get_available_runners
+    :param concurrency: Лимиты одновременных задач по id раннера
+    """
+    def fetch(runner: Dict) -> RunnerCapacity:
+        base = f"{gitlab_url}/api/v4/runners/{runner['id']}"
+        details = session.get(base, headers=headers, timeout=30)
+        details.raise_for_status()
+        jobs = session.get(f"{base}/jobs", headers=headers, params={'status': 'running', 'per_page': 100},
+                           timeout=30)
+        jobs.raise_for_status()
+        running_jobs = int(jobs.headers.get('X-Total') or len(jobs.json()))
+        return runner_capacity_from_api(details.json(), running_jobs,
+                                        concurrency.get(runner['id'], default_concurrency),
+                                        count_fuzz_jobs(jobs.json()))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return RunnerCapacityModel(list(executor.map(fetch, runners)))
+
+
+class _CiConfigLoader(yaml.SafeLoader):
+    """SafeLoader, пропускающий теги GitLab CI (!reference и другие) вместо ошибки разбора"""
+
+
+_CiConfigLoader.add_multi_constructor('!', lambda loader, suffix, node: None)
+
+
+def _resolve_extends(ci_config: Dict, job: Dict, seen: Tuple[str, ...] = ()) -> Dict:
+    """Ключи задачи с учетом extends: шаблоны применяются по порядку, собственные ключи задачи — последними"""
+    extends = job.get('extends')
+    if not extends:
+        return job
+    resolved: Dict = {}
+    for name in [extends] if isinstance(extends, str) else extends:
+        parent = ci_config.get(name)
+        if isinstance(parent, dict) and name not in seen:
+            resolved.update(_resolve_extends(ci_config, parent, seen + (name,)))
+    resolved.update(job)
+    return resolved
+
+
+def fuzz_job_tags(ci_config: Dict, job_keyword: str = "fuzz") -> Optional[FrozenSet[FrozenSet[str]]]:
+    """
+    Наборы тегов задач фаззинга — задач, в имени или стадии которых есть job_keyword.
+    Каждая задача берет раннер сама, поэтому пайплайну нужен свободный слот для каждого набора.
+    Теги наследуются через extends, задачи без тегов получают default:tags. Теги с переменными ($VAR)
+    не учитываются. None — задач фаззинга в конфигурации нет, требования к раннеру неизвестны
+    """
+    default = ci_config.get('default') if isinstance(ci_config.get('default'), dict) else {}
+    default_tags = default.get('tags') or []
+    tag_sets = set()
+    for name, job in ci_config.items():
+        if not isinstance(job, dict) or name.startswith('.'):
+            continue
+        job = _resolve_extends(ci_config, job)
+        if job_keyword not in name.lower() and job_keyword not in str(job.get('stage', '')).lower():
+            continue
+        tags = job.get('tags') or default_tags
+        tag_sets.add(frozenset(t for t in tags if isinstance(t, str) and '$' not in t))
+    return frozenset(tag_sets) if tag_sets else None
+
+
+class FuzzJobTagResolver:
+    """
+    Наборы тегов раннеров для задач фаззинга проекта по его .gitlab-ci.yml.
+    Результат кэшируется по SHA blob'а конфигурации: файл загружается только после его изменения.
+    """
+
+    def __init__(self, session, gitlab_url: str, headers: Dict[str, str], job_keyword: str = "fuzz"):
+        self.session = session
+        self.gitlab_url = gitlab_url
+        self.headers = headers
+        self.job_keyword = job_keyword
+        self.cache: Dict[str, Optional[FrozenSet[FrozenSet[str]]]] = {}
+        self._lock = Lock()
+
+    def job_tag_sets(self, project) -> Optional[FrozenSet[FrozenSet[str]]]:
+        """Наборы тегов задач фаззинга проекта (ProjectInfo) или None, если определить их не удалось"""
+        blob_id = project.ci_blob_id
+        if not blob_id:
+            return None
+        with self._lock:
+            if blob_id in self.cache:
+                return self.cache[blob_id]
+
+        try:
+            response = self.session.get(
+                f"{self.gitlab_url}/api/v4/projects/{project.id}/repository/blobs/{blob_id}/raw",
+                headers=self.headers, timeout=30)
+            response.raise_for_status()
+            ci_config = yaml.load(response.text, Loader=_CiConfigLoader) or {}
+        except (requests.RequestException, yaml.YAMLError) as e:
+            print(f"[WARN] Не удалось разобрать .gitlab-ci.yml проекта {project.path_with_namespace}: {e}")
+            return None
+
+        tags = fuzz_job_tags(ci_config, self.job_keyword) if isinstance(ci_config, dict) else None
+        with self._lock:
+            self.cache[blob_id] = tags
+        return tags
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+from gitlab.v4.objects import GroupManager
+
+# Модули планировщика лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import FuzzingPipelineScheduler  # noqa: E402
+
+
+@pytest.fixture
+def make_scheduler(monkeypatch):
+    """Фабрика планировщиков без обращений к GitLab при создании: группа создается lazy объектом"""
+    get = GroupManager.get
+    monkeypatch.setattr(GroupManager, 'get', lambda self, id, lazy=False, **kwargs: get(self, id, lazy=True))
+
+    def make(cls=FuzzingPipelineScheduler, gitlab_url="https://gitlab.example.com", **kwargs):
+        return cls(gitlab_url, "token", group_id=1, **kwargs)
+
+    return make
+
+
+@pytest.fixture
+def scheduler(make_scheduler):
+    return make_scheduler()
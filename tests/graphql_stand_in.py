@@ -0,0 +1,46 @@
+from typing import Dict, List, Optional, Set
+
+
+class LocalGraphQLStandIn:
+    """
+    Локальная замена GraphQL API GitLab для тестов GraphQLProjectDiscovery.
+    Отдает заранее заданные проекты страницами в формате ответа GitLab;
+    поля из unsupported_fields отклоняются так же, как это делает инстанс без их поддержки.
+    """
+
+    def __init__(self, projects: List[Dict], unsupported_fields: Optional[Set[str]] = None):
+        """
+        :param projects: Узлы проектов в формате GraphQL (id, name, fullPath, webUrl, archived, repository, pipelines)
+        :param unsupported_fields: Имена полей, которых «нет» на инстансе
+        """
+        self.projects = projects
+        self.unsupported_fields = unsupported_fields or set()
+        self.requests: List[Dict] = []
+
+    def execute(self, query: str, variables: Dict) -> Dict:
+        self.requests.append({'query': query, 'variables': variables})
+
+        errors = [{'message': f"Field '{name}' doesn't exist on type 'Repository'"}
+                  for name in sorted(self.unsupported_fields) if f"{name}(" in query or f" {name} " in query]
+        if errors:
+            return {'errors': errors}
+
+        start = int(variables.get('after') or 0)
+        end = start + variables['first']
+        nodes = []
+        for project in self.projects[start:end]:
+            node = {k: v for k, v in project.items() if k not in ('repository', 'pipelines')}
+            repository = project.get('repository')
+            if repository is not None:
+                node['repository'] = {k: v for k, v in repository.items()
+                                      if k == 'rootRef' or f"{k}(" in query}
+            else:
+                node['repository'] = None
+            if 'pipelines(' in query:
+                node['pipelines'] = project.get('pipelines')
+            nodes.append(node)
+
+        return {'data': {'group': {'projects': {
+            'pageInfo': {'hasNextPage': end < len(self.projects), 'endCursor': str(end)},
+            'nodes': nodes,
+        }}}}
@@ -0,0 +1,163 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from async_scheduler import AsyncFuzzingPipelineScheduler, AsyncHttpClient
+
+
+async def serve(routes, body):
+    """Запуск body(base_url) против локального сервера с GET (и HEAD) обработчиками routes"""
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        return await body(f"http://127.0.0.1:{port}")
+    finally:
+        await runner.cleanup()
+
+
+def test_response_headers_are_case_insensitive():
+    async def pipelines(request):
+        # Прокси и Rack 3 передают заголовки в нижнем регистре
+        return web.json_response([], headers={'x-total': "12", 'x-next-page': "2"})
+
+    async def body(base):
+        async with AsyncHttpClient() as client:
+            _, headers = await client.get(f"{base}/pipelines")
+            _, head_headers = await client.request("HEAD", f"{base}/pipelines")
+        return headers, head_headers
+
+    headers, head_headers = asyncio.run(serve({'/pipelines': pipelines}, body))
+
+    assert headers.get('X-Total') == "12"
+    assert headers.get('X-Next-Page') == "2"
+    assert head_headers.get('X-Total') == "12"
+
+
+def run_scheduler(make_scheduler, routes, body):
+    """Запуск body(scheduler) с AsyncFuzzingPipelineScheduler, направленным на локальный сервер routes"""
+    async def run(base):
+        scheduler = make_scheduler(AsyncFuzzingPipelineScheduler, gitlab_url=base)
+        async with AsyncHttpClient() as client:
+            scheduler.client = client
+            return await body(scheduler)
+
+    return asyncio.run(serve(routes, run))
+
+
+def project_json(project_id):
+    return {'id': project_id, 'name': f"p{project_id}", 'path_with_namespace': f"fuzz/p{project_id}",
+            'web_url': f"https://gitlab.example.com/fuzz/p{project_id}", 'default_branch': "main"}
+
+
+def test_projects_are_listed_with_keyset_pagination(make_scheduler):
+    listing_requests = []
+
+    async def projects(request):
+        listing_requests.append(dict(request.query))
+        if 'id_after' not in request.query:
+            next_url = request.url.update_query({'id_after': "2"})
+            return web.json_response([project_json(1), project_json(2)],
+                                     headers={'Link': f'<{next_url}>; rel="next"'})
+        return web.json_response([project_json(3)])
+
+    async def no_branch(request):
+        return web.json_response({'message': "404 Branch Not Found"}, status=404)
+
+    result = run_scheduler(make_scheduler, {
+        '/api/v4/groups/1/projects': projects,
+        '/api/v4/projects/{id}/repository/branches/main': no_branch,
+    }, lambda scheduler: scheduler.get_fuzzing_projects_async())
+
+    assert [p.id for p in result] == [1, 2, 3]
+    assert not any(p.main_branch_exists for p in result)
+    # Пустая страница в конце не запрашивается
+    assert len(listing_requests) == 2
+    first = listing_requests[0]
+    assert first['pagination'] == "keyset" and first['order_by'] == "id"
+    assert first['archived'] == "false" and first['simple'] == "true"
+
+
+def test_configured_backend_is_used(make_scheduler):
+    project = object()
+
+    async def body(scheduler):
+        scheduler.discovery_backend = SimpleNamespace(get_fuzzing_projects=lambda: [project])
+        return await scheduler.get_fuzzing_projects_async()
+
+    assert run_scheduler(make_scheduler, {}, body) == [project]
+
+
+def test_enrichment_parses_branch_and_caches_ci_file_by_head_sha(make_scheduler):
+    calls = []
+    head = {'sha': "aaa"}
+
+    async def branch(request):
+        calls.append('branch')
+        return web.json_response({'name': "main", 'commit': {
+            'id': head['sha'], 'committed_date': "2024-05-01T10:00:00.000+00:00"}})
+
+    async def ci_file(request):
+        if request.method == "HEAD":
+            calls.append(('head', request.query['ref']))
+        return web.Response(headers={'X-Gitlab-Blob-Id': f"blob-{head['sha']}"})
+
+    async def pipelines(request):
+        return web.json_response([{'id': 5, 'updated_at': "2024-05-02T10:00:00.000+00:00"}], headers={'X-Total': "1"})
+
+    async def body(scheduler):
+        first = await scheduler.enrich_project_async(project_json(1))
+        second = await scheduler.enrich_project_async(project_json(1))
+        head['sha'] = "bbb"
+        third = await scheduler.enrich_project_async(project_json(1))
+        return first, second, third
+
+    first, second, third = run_scheduler(make_scheduler, {
+        '/api/v4/projects/1/repository/branches/main': branch,
+        '/api/v4/projects/1/repository/files/.gitlab-ci.yml': ci_file,
+        '/api/v4/projects/1/pipelines': pipelines,
+    }, body)
+
+    assert first.last_modified.isoformat() == "2024-05-01T10:00:00+00:00"
+    assert first.has_gitlab_ci_file and first.ci_blob_id == "blob-aaa"
+    assert second.ci_blob_id == "blob-aaa"
+    assert third.ci_blob_id == "blob-bbb"
+    # Файл перепроверяется только после сдвига головного коммита, отдельного запроса коммитов нет
+    assert [c for c in calls if c != 'branch'] == [('head', "aaa"), ('head', "bbb")]
+
+
+def test_ci_file_errors_are_not_cached(make_scheduler):
+    status = {'code': 403}
+
+    async def branch(request):
+        return web.json_response({'name': "main", 'commit': {
+            'id': "aaa", 'committed_date': "2024-05-01T10:00:00.000+00:00"}})
+
+    async def ci_file(request):
+        return web.Response(status=status['code'])
+
+    async def pipelines(request):
+        return web.json_response([], headers={'X-Total': "0"})
+
+    async def body(scheduler):
+        denied = await scheduler.enrich_project_async(project_json(1))
+        status['code'] = 404
+        missing = await scheduler.enrich_project_async(project_json(1))
+        return denied, missing, scheduler.ci_file_probe.cached(1, "aaa")
+
+    denied, missing, cached = run_scheduler(make_scheduler, {
+        '/api/v4/projects/1/repository/branches/main': branch,
+        '/api/v4/projects/1/repository/files/.gitlab-ci.yml': ci_file,
+        '/api/v4/projects/1/pipelines': pipelines,
+    }, body)
+
+    # 403 не означает отсутствие файла: проект пропускается в этом цикле и проверяется снова
+    assert denied is None
+    assert missing is not None and not missing.has_gitlab_ci_file
+    assert cached == (False, None)
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from capacity_forecast import RunnerUtilizationStore, plan_dispatches
+from runners import RunnerCapacity, RunnerCapacityModel
+
+NOW = datetime(2024, 5, 6, 12, 0, tzinfo=timezone.utc)
+
+
+class CountingStop:
+    """Event для run_forever: останавливает цикл после cycles пауз и запоминает их длительность"""
+
+    def __init__(self, cycles):
+        self.cycles = cycles
+        self.delays = []
+
+    def is_set(self):
+        return len(self.delays) >= self.cycles
+
+    def wait(self, timeout):
+        self.delays.append(timeout)
+
+
+def runner(runner_id, concurrency=1, running_jobs=0):
+    return RunnerCapacity(id=runner_id, description="", tags=frozenset(), run_untagged=True, online=True,
+                          paused=False, concurrency=concurrency, running_jobs=running_jobs)
+
+
+def test_plan_dispatches_fills_windows_in_priority_order():
+    windows = [(NOW, 0.4), (NOW + timedelta(minutes=10), 2.7), (NOW + timedelta(minutes=20), 5.0)]
+
+    plan = plan_dispatches(["a", "b", "c", "d"], windows)
+
+    # Окно с дробной емкостью меньше слота пропускается, проекты распределяются по убыванию приоритета
+    assert plan == [(windows[1][0], ["a", "b"]), (windows[2][0], ["c", "d"])]
+
+
+def test_plan_dispatches_stops_when_backlog_is_empty():
+    assert plan_dispatches([], [(NOW, 3.0)]) == []
+    assert plan_dispatches(["a"], [(NOW, 3.0), (NOW + timedelta(minutes=10), 3.0)]) == [(NOW, ["a"])]
+
+
+def test_forecast_uses_same_hour_of_week(tmp_path):
+    store = RunnerUtilizationStore(str(tmp_path / "cache.sqlite3"), retention=timedelta(weeks=8))
+    week_ago = NOW - timedelta(weeks=1)
+    store.record(8, 0, 0, ts=(week_ago + timedelta(minutes=10)).timestamp())
+    store.record(0, 4, 3, ts=(NOW - timedelta(minutes=5)).timestamp())
+
+    [(at, free_slots)] = store.forecast(1, timedelta(minutes=10), now=NOW, recent_weight=0.5)
+
+    assert at == NOW + timedelta(minutes=10)
+    # Сезонная составляющая за тот же час неделю назад, смешанная с последним наблюдением
+    assert free_slots == 0.5 * 0 + 0.5 * 8
+
+
+def test_run_forever_waits_cycle_interval_after_failed_cycle(scheduler):
+    # План предыдущего цикла с окном в прошлом не должен приводить к нулевой паузе
+    scheduler.dispatch_plan = [(datetime.now(timezone.utc) - timedelta(minutes=5), [])]
+
+    def failing_cycle():
+        raise RuntimeError("GitLab API error: 502")
+
+    scheduler.schedule_pipelines = failing_cycle
+    stop = CountingStop(3)
+
+    scheduler.run_forever(stop)
+
+    assert stop.delays == [scheduler.cycle_interval.total_seconds()] * 3
+
+
+def test_early_return_discards_previous_plan(scheduler):
+    scheduler.dispatch_plan = [(datetime.now(timezone.utc) - timedelta(minutes=5), [])]
+    scheduler.current_runner_capacity = lambda: RunnerCapacityModel([runner(1)])
+    scheduler.discovery_backend = SimpleNamespace(get_fuzzing_projects=lambda: [])
+    stop = CountingStop(1)
+
+    scheduler.run_forever(stop)
+
+    assert scheduler.dispatch_plan == []
+    assert stop.delays == [scheduler.cycle_interval.total_seconds()]
+
+
+def test_next_cycle_delay_is_bounded_below(scheduler):
+    now = datetime.now(timezone.utc)
+    scheduler.dispatch_plan = [(now - timedelta(minutes=1), [])]
+    assert scheduler.next_cycle_delay() == scheduler.min_cycle_delay.total_seconds()
+
+    scheduler.dispatch_plan = [(now + timedelta(minutes=5), [])]
+    assert 280 < scheduler.next_cycle_delay() <= 300
+
+    scheduler.dispatch_plan = []
+    assert scheduler.next_cycle_delay() == scheduler.cycle_interval.total_seconds()
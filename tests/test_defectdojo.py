@@ -0,0 +1,154 @@
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from defectdojo import DefectDojoFindingsStore
+
+URL = "https://defectdojo.example.com"
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise AssertionError(f"unexpected status {self.status_code}")
+
+    def json(self):
+        return self.data
+
+
+class FakeDefectDojo:
+    """Списки DefectDojo API v2 с limit/offset, ссылками next и сортировкой o (NULL первыми, как в PostgreSQL)"""
+
+    def __init__(self, findings, tests=None, engagements=None):
+        self.findings = findings
+        self.tests = tests or [{'id': 1, 'engagement': 1}]
+        self.engagements = engagements or [{'id': 1, 'product': 100}]
+        self.requests = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        parts = urlsplit(url)
+        params = {**dict(parse_qsl(parts.query)), **{k: str(v) for k, v in (params or {}).items()}}
+        path = parts.path
+        self.requests.append((path, params))
+        items = {'/api/v2/findings/': self.findings, '/api/v2/tests/': self.tests,
+                 '/api/v2/engagements/': self.engagements}[path]
+        items = [i for i in items if all(str(i.get(k)).lower() == v for k, v in params.items()
+                                         if k in ('active', 'verified', 'false_p', 'duplicate'))]
+        order = params.get('o')
+        if order == '-last_status_update':
+            nulls = [i for i in items if i['last_status_update'] is None]
+            items = nulls + sorted((i for i in items if i['last_status_update'] is not None),
+                                   key=lambda i: i['last_status_update'], reverse=True)
+        elif order == 'id':
+            items = sorted(items, key=lambda i: i['id'])
+
+        offset, limit = int(params.get('offset', 0)), int(params.get('limit', 100))
+        page = items[offset:offset + limit]
+        next_url = None
+        if offset + limit < len(items):
+            next_url = f"{URL}{path}?{urlencode({**params, 'offset': offset + limit})}"
+        return FakeResponse({'count': len(items), 'next': next_url, 'results': page})
+
+    def findings_requests(self):
+        return [params for path, params in self.requests if path == '/api/v2/findings/']
+
+
+def finding(finding_id, last_status_update, severity="High", active=True, found="2024-05-01", updated=None):
+    return {'id': finding_id, 'test': 1, 'severity': severity, 'date': found, 'active': active,
+            'verified': True, 'false_p': False, 'duplicate': False,
+            'last_status_update': last_status_update, 'updated': updated or last_status_update}
+
+
+PROJECT = SimpleNamespace(id=1, name="p")
+PRODUCT_INDEX = SimpleNamespace(product_id=lambda project: 100)
+
+
+def make_store(api, tmp_path, **kwargs):
+    return DefectDojoFindingsStore(api, URL, "token", PRODUCT_INDEX, path=str(tmp_path / "cache.sqlite3"),
+                                   page_size=2, overlap=0, **kwargs)
+
+
+def legacy_findings(count, start_id=1000):
+    # Старые находки без last_status_update, закрытые, — в инкрементальном проходе их читать не нужно
+    return [finding(start_id + i, None, active=False, updated="2020-01-01T00:00:00Z") for i in range(count)]
+
+
+def test_incremental_sync_applies_deltas(tmp_path):
+    api = FakeDefectDojo([
+        finding(1, "2024-05-01T10:00:00Z"),
+        finding(2, "2024-05-01T11:00:00Z", severity="Low"),
+        finding(3, "2024-05-01T09:00:00Z", active=False),
+    ] + legacy_findings(3))
+    store = make_store(api, tmp_path)
+    store.sync_full()
+    assert store.counts == {100: 2}
+    assert store.watermark == datetime(2024, 5, 1, 11, 0, tzinfo=timezone.utc)
+
+    # Находка 1 закрыта, находка 3 переоткрыта, находка 4 создана
+    api.findings[0] = finding(1, "2024-05-02T08:00:00Z", active=False)
+    api.findings[2] = finding(3, "2024-05-02T09:00:00Z", severity="Critical")
+    api.findings.append(finding(4, "2024-05-02T10:00:00Z", severity="Critical"))
+    store.sync_incremental()
+
+    assert store.counts == {100: 3}
+    assert store.severity_age_counts(PROJECT, today=date(2024, 5, 3)) == {('Low', 0): 1, ('Critical', 0): 2}
+    assert store.watermark == datetime(2024, 5, 2, 10, 0, tzinfo=timezone.utc)
+
+    # Состояние восстанавливается из SQLite после перезапуска
+    restarted = make_store(api, tmp_path)
+    assert restarted.counts == {100: 3}
+    assert restarted.watermark == store.watermark
+
+
+def test_incremental_sync_skips_legacy_null_block(tmp_path):
+    api = FakeDefectDojo([finding(1, "2024-05-01T10:00:00Z")] + legacy_findings(40))
+    store = make_store(api, tmp_path)
+    store.sync_full()
+
+    api.requests.clear()
+    store.sync_incremental()
+    # Бинарный поиск границы блока: O(log N) запросов, а не обход 40 старых находок по 2 на страницу
+    first_pass = len(api.findings_requests())
+    assert store.null_block == 40
+    assert first_pass < 10
+
+    api.requests.clear()
+    api.findings.append(finding(2, "2024-05-02T10:00:00Z"))
+    store.sync_incremental()
+    # Известная граница проверяется одним запросом, затем читаются только изменения
+    requests = api.findings_requests()
+    assert requests[0]['offset'] == "39" and requests[0]['limit'] == "2"
+    assert len(requests) == 2
+    assert store.counts == {100: 2}
+
+
+def test_null_block_is_searched_again_when_it_shrinks(tmp_path):
+    api = FakeDefectDojo([finding(1, "2024-05-01T10:00:00Z")] + legacy_findings(5))
+    store = make_store(api, tmp_path)
+    store.sync_full()
+    store.sync_incremental()
+    assert store.null_block == 5
+
+    # Старая находка переоткрыта: у нее появился last_status_update, блок уменьшился
+    api.findings[1] = finding(1000, "2024-05-02T10:00:00Z")
+    store.sync_incremental()
+
+    assert store.null_block == 4
+    assert store.counts == {100: 2}
+    assert make_store(api, tmp_path).null_block == 4
+
+
+def test_missing_null_block(tmp_path):
+    api = FakeDefectDojo([finding(1, "2024-05-01T10:00:00Z")])
+    store = make_store(api, tmp_path)
+    store.sync_full()
+
+    api.findings.append(finding(2, "2024-05-02T10:00:00Z"))
+    store.sync_incremental()
+
+    assert store.null_block == 0
+    assert store.counts == {100: 2}
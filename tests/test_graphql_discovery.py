@@ -0,0 +1,198 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import gitlab
+import pytest
+
+from graphql_discovery import GraphQLError, GraphQLProjectDiscovery, build_projects_query
+from graphql_stand_in import LocalGraphQLStandIn
+from main import PipelineSummaryTracker
+
+
+class FakePipelineList(list):
+    total = None
+
+
+class FakeRestProject:
+    """Проект python-gitlab для REST запросов, которыми дополняются неподдерживаемые поля"""
+
+    def __init__(self, project_id, main_exists=True, ci_blob=None, pipelines=()):
+        self.id = project_id
+        self.calls = []
+        self.branches = SimpleNamespace(get=self._get_branch)
+        self.commits = SimpleNamespace(list=lambda **kwargs: [
+            SimpleNamespace(committed_date="2024-05-01T10:00:00.000+00:00")])
+        self.files = SimpleNamespace(head=self._head_file)
+        self.pipelines = SimpleNamespace(list=self._list_pipelines)
+        self.main_exists = main_exists
+        self.ci_blob = ci_blob
+        self.pipeline_pages = list(pipelines)
+
+    def _get_branch(self, name):
+        self.calls.append(('branch', name))
+        if not self.main_exists:
+            raise gitlab.exceptions.GitlabGetError("404 Branch Not Found", response_code=404)
+        return SimpleNamespace(name=name)
+
+    def _head_file(self, path, ref):
+        self.calls.append(('file', path))
+        if self.ci_blob is None:
+            raise gitlab.exceptions.GitlabHeadError("404 File Not Found", response_code=404)
+        return {'X-Gitlab-Blob-Id': self.ci_blob}
+
+    def _list_pipelines(self, **kwargs):
+        self.calls.append(('pipelines', kwargs.get('ref')))
+        pipelines = FakePipelineList(SimpleNamespace(id=i, updated_at=updated) for i, updated in self.pipeline_pages)
+        pipelines.total = len(pipelines)
+        return pipelines
+
+
+def make_scheduler(rest_projects=None):
+    rest_projects = rest_projects or {}
+    return SimpleNamespace(
+        group=SimpleNamespace(full_path="fuzz"),
+        gl=SimpleNamespace(projects=SimpleNamespace(get=lambda project_id, lazy=False: rest_projects[project_id])),
+        pipeline_summary=PipelineSummaryTracker(),
+    )
+
+
+def project_node(project_id, tree=None, blobs=None, pipelines=None, name=None):
+    return {
+        'id': f"gid://gitlab/Project/{project_id}",
+        'name': name or f"project-{project_id}",
+        'fullPath': f"fuzz/project-{project_id}",
+        'webUrl': f"https://gitlab.example.com/fuzz/project-{project_id}",
+        'archived': False,
+        'repository': {'rootRef': "main", 'tree': tree, 'blobs': blobs},
+        'pipelines': pipelines,
+    }
+
+
+# Скаляр Time в GraphQL GitLab передается без долей секунды
+READY_TREE = {'lastCommit': {'committedDate': "2024-05-02T08:30:00Z"}}
+CI_BLOBS = {'nodes': [{'path': ".gitlab-ci.yml", 'oid': "abc123"}]}
+PIPELINES = {'count': 7, 'nodes': [{'updatedAt': "2024-05-03T15:00:00+03:00"}]}
+
+
+def test_collects_facts_across_pages():
+    transport = LocalGraphQLStandIn([
+        project_node(1, READY_TREE, CI_BLOBS, PIPELINES),
+        project_node(2, READY_TREE, {'nodes': []}, {'count': 0, 'nodes': []}),
+        project_node(3, READY_TREE, CI_BLOBS, PIPELINES),
+    ])
+    discovery = GraphQLProjectDiscovery(make_scheduler(), transport=transport, page_size=2)
+
+    projects = discovery.get_fuzzing_projects()
+
+    assert [p.id for p in projects] == [1, 2, 3]
+    assert len(transport.requests) == 2
+    assert transport.requests[1]['variables']['after'] == "2"
+    first = projects[0]
+    assert first.main_branch_exists and first.has_gitlab_ci_file
+    assert first.ci_blob_id == "abc123"
+    assert first.pipeline_run_count == 7
+    assert first.last_modified.isoformat() == "2024-05-02T08:30:00+00:00"
+    assert first.last_pipeline_run == datetime(2024, 5, 3, 12, 0, tzinfo=timezone.utc)
+    assert not projects[1].has_gitlab_ci_file
+    assert projects[1].ci_blob_id is None
+
+
+def test_missing_main_branch_is_detected_by_last_commit():
+    # Для несуществующей ветки GitLab возвращает tree без lastCommit
+    transport = LocalGraphQLStandIn([
+        project_node(1, {'lastCommit': None}, {'nodes': []}, {'count': 0, 'nodes': []}),
+        project_node(2, None, None, None),
+    ])
+    discovery = GraphQLProjectDiscovery(make_scheduler(), transport=transport)
+
+    projects = discovery.get_fuzzing_projects()
+
+    assert [p.main_branch_exists for p in projects] == [False, False]
+    assert [p.last_modified for p in projects] == [None, None]
+
+
+def test_unsupported_field_falls_back_to_rest(capsys):
+    transport = LocalGraphQLStandIn([
+        project_node(1, READY_TREE, None, PIPELINES),
+        project_node(2, READY_TREE, None, PIPELINES),
+    ], unsupported_fields={'blobs'})
+    rest = {1: FakeRestProject(1, ci_blob="def456"), 2: FakeRestProject(2)}
+    discovery = GraphQLProjectDiscovery(make_scheduler(rest), transport=transport)
+
+    projects = discovery.get_fuzzing_projects()
+
+    # Первый запрос отклонен, повторный отправлен без фрагмента blobs
+    assert len(transport.requests) == 2
+    assert 'blobs(' not in transport.requests[1]['query']
+    assert discovery.unsupported == {'blobs'}
+    assert "[WARN]" in capsys.readouterr().out
+    assert projects[0].has_gitlab_ci_file and projects[0].ci_blob_id == "def456"
+    assert not projects[1].has_gitlab_ci_file
+    assert rest[1].calls == [('file', ".gitlab-ci.yml")]
+    # Факты, полученные через GraphQL, в REST не запрашиваются
+    assert projects[0].pipeline_run_count == 7
+
+
+def test_unsupported_tree_checks_branch_before_other_fallbacks():
+    transport = LocalGraphQLStandIn([project_node(1, None, None, None)],
+                                    unsupported_fields={'tree', 'blobs', 'pipelines'})
+    rest = {1: FakeRestProject(1, main_exists=False, ci_blob="abc")}
+    discovery = GraphQLProjectDiscovery(make_scheduler(rest), transport=transport)
+
+    [project] = discovery.get_fuzzing_projects()
+
+    assert not project.main_branch_exists
+    assert not project.has_gitlab_ci_file
+    # Без ветки main наличие .gitlab-ci.yml и пайплайны не проверяются
+    assert rest[1].calls == [('branch', "main")]
+
+
+def test_rest_fallback_collects_pipelines_and_branch():
+    transport = LocalGraphQLStandIn([project_node(1, None, None, None)],
+                                    unsupported_fields={'tree', 'pipelines'})
+    rest = {1: FakeRestProject(1, pipelines=[(12, "2024-05-04T00:00:00.000+00:00"), (11, None)])}
+    # blobs поддерживается, но в ответе stand-in его нет — файл считается отсутствующим
+    discovery = GraphQLProjectDiscovery(make_scheduler(rest), transport=transport)
+
+    [project] = discovery.get_fuzzing_projects()
+
+    assert project.main_branch_exists
+    assert project.last_modified.isoformat() == "2024-05-01T10:00:00+00:00"
+    assert project.pipeline_run_count == 2
+    assert project.last_pipeline_run.isoformat() == "2024-05-04T00:00:00+00:00"
+
+
+def test_unknown_errors_are_raised():
+    class FailingTransport:
+        def execute(self, query, variables):
+            return {'errors': [{'message': "Internal server error"}]}
+
+    discovery = GraphQLProjectDiscovery(make_scheduler(), transport=FailingTransport())
+
+    with pytest.raises(GraphQLError):
+        discovery.get_fuzzing_projects()
+
+
+def test_query_omits_unsupported_fragments():
+    query = build_projects_query({'tree', 'pipelines'})
+
+    assert 'blobs(' in query
+    assert 'tree(' not in query and 'pipelines(' not in query
+
+
+def test_rest_ci_file_errors_other_than_404_skip_project(capsys):
+    class ForbiddenProject(FakeRestProject):
+        def _head_file(self, path, ref):
+            raise gitlab.exceptions.GitlabHeadError("403 Forbidden", response_code=403)
+
+    transport = LocalGraphQLStandIn([project_node(1, READY_TREE, None, PIPELINES),
+                                     project_node(2, READY_TREE, None, PIPELINES)],
+                                    unsupported_fields={'blobs'})
+    rest = {1: ForbiddenProject(1), 2: FakeRestProject(2, ci_blob="abc")}
+    discovery = GraphQLProjectDiscovery(make_scheduler(rest), transport=transport)
+
+    projects = discovery.get_fuzzing_projects()
+
+    # Проект с ошибкой пропускается, а не считается проектом без .gitlab-ci.yml
+    assert [p.id for p in projects] == [2]
+    assert "fuzz/project-1" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+import pytest
+
+import http_client
+from http_client import RequestGovernor
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(http_client.time, 'monotonic', clock)
+    return clock
+
+
+def respond(governor, status_code, headers=None):
+    assert governor.try_acquire() == 0.0
+    governor.release(status_code, headers or {})
+
+
+def test_success_grows_limit_additively(clock):
+    governor = RequestGovernor(initial_limit=4, max_limit=6)
+    for _ in range(4):
+        respond(governor, 200)
+    # За «раунд» из limit успешных ответов лимит растет примерно на additive_step
+    assert 4.9 < governor.limit < 5.0
+
+    for _ in range(100):
+        respond(governor, 200)
+    assert governor.limit == 6
+
+
+def test_429_halves_limit_and_pauses(clock):
+    governor = RequestGovernor(initial_limit=8)
+    respond(governor, 429, {'Retry-After': "5"})
+
+    assert governor.limit == 4
+    assert governor.throttled_total == 1
+    assert governor.try_acquire() == pytest.approx(5)
+
+    clock.now += 5
+    assert governor.try_acquire() == 0.0
+
+
+def test_wave_of_429_decreases_once(clock):
+    governor = RequestGovernor(initial_limit=8)
+    for _ in range(3):
+        assert governor.try_acquire() == 0.0
+    for _ in range(3):
+        governor.release(429, {})
+    assert governor.limit == 4
+
+    # Следующая волна отказов спустя секунду снижает лимит снова, но не ниже min_limit
+    for _ in range(4):
+        clock.now += 1
+        governor.paused_until = 0.0
+        respond(governor, 429)
+    assert governor.limit == 1
+
+
+def test_low_rate_limit_remaining_decreases_without_pause(clock):
+    governor = RequestGovernor(initial_limit=8, low_remaining_ratio=0.1)
+    respond(governor, 200, {'RateLimit-Remaining': "50", 'RateLimit-Limit': "600"})
+
+    assert governor.limit == 4
+    assert governor.rate_limit_remaining == 50
+    assert governor.try_acquire() == 0.0
+
+
+def test_sufficient_rate_limit_remaining_keeps_growing(clock):
+    governor = RequestGovernor(initial_limit=8)
+    respond(governor, 200, {'RateLimit-Remaining': "300", 'RateLimit-Limit': "600"})
+
+    assert governor.limit > 8
+
+
+def test_exhausted_rate_limit_pauses_until_reset(clock, monkeypatch):
+    monkeypatch.setattr(http_client.time, 'time', lambda: 1_700_000_000.0)
+    governor = RequestGovernor(initial_limit=8)
+    respond(governor, 200, {'RateLimit-Remaining': "0", 'RateLimit-Limit': "600",
+                            'RateLimit-Reset': "1700000030"})
+
+    assert governor.limit == 4
+    assert governor.try_acquire() == pytest.approx(30)
+
+
+def test_limit_bounds_concurrency(clock):
+    governor = RequestGovernor(initial_limit=2)
+    assert governor.try_acquire() == 0.0
+    assert governor.try_acquire() == 0.0
+    assert governor.try_acquire() > 0
+
+    governor.release()
+    # Освобождение слота без ответа не влияет на лимит
+    assert governor.limit == 2
+    assert governor.try_acquire() == 0.0
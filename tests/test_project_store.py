@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+
+from main import PipelineSummaryTracker
+from project_store import CachedProjectEnricher, ProjectStore
+
+LISTING = {'name': "p", 'path_with_namespace': "fuzz/p", 'web_url': "https://gitlab.example.com/fuzz/p",
+           'default_branch': "main", 'archived': False}
+
+
+def test_counter_is_persisted_once_and_restored(tmp_path):
+    store = ProjectStore(str(tmp_path / "cache.sqlite3"))
+    tracker = PipelineSummaryTracker(page_size=3, store=store)
+    tracker.update(1, [(12, None), (11, None)], None)
+
+    assert store.get_fact(1, PipelineSummaryTracker.STORE_FACT).value == [2, 12]
+
+    restarted = PipelineSummaryTracker(page_size=3, store=store)
+    assert restarted.known(1) == (2, 12)
+    # Полная первая страница без X-Total: известный счетчик продолжается, поиск страниц не нужен
+    assert not restarted.needs_seed(1, [(15, None), (14, None), (13, None)], None)
+    assert restarted.update(1, [(15, None), (14, None), (13, None)], None).pipeline_run_count == 5
+
+
+def test_recorded_pipeline_updates_tracker_only(scheduler, tmp_path):
+    store = ProjectStore(str(tmp_path / "cache.sqlite3"))
+    enricher = CachedProjectEnricher(scheduler, store)
+    store.put_fact(1, 'project', LISTING)
+    store.put_fact(1, 'main_branch', {'exists': True, 'commit_sha': "abc", 'last_modified': None})
+    scheduler.pipeline_summary.update(1, [(7, None)], 40)
+
+    started_at = datetime(2024, 5, 6, 12, 0, tzinfo=timezone.utc)
+    enricher.record_pipeline(1, 8, started_at)
+
+    assert store.get_fact(1, 'pipelines').value == {'last_pipeline_run': started_at.isoformat()}
+    assert store.get_fact(1, PipelineSummaryTracker.STORE_FACT).value == [41, 8]
+    project = enricher.load(1)
+    assert project.pipeline_run_count == 41
+    assert project.last_pipeline_run == started_at
+
+
+def test_recorded_pipeline_does_not_create_counter(scheduler, tmp_path):
+    store = ProjectStore(str(tmp_path / "cache.sqlite3"))
+    enricher = CachedProjectEnricher(scheduler, store)
+
+    enricher.record_pipeline(1, 8, datetime.now(timezone.utc))
+
+    # Счетчик 1 для проекта с неизвестным числом запусков отключил бы поиск страниц при следующем сборе
+    assert scheduler.pipeline_summary.known(1) is None
+    assert store.get_fact(1, PipelineSummaryTracker.STORE_FACT) is None
@@ -0,0 +1,142 @@
+from types import SimpleNamespace
+
+import yaml
+
+from runners import RunnerCapacity, RunnerCapacityModel, _CiConfigLoader, fuzz_job_tags
+
+
+def runner(runner_id, tags=(), run_untagged=False, concurrency=1, running_jobs=0,
+           runner_type="group_type", project_ids=(), online=True, paused=False):
+    return RunnerCapacity(id=runner_id, description=f"runner-{runner_id}", tags=frozenset(tags),
+                          run_untagged=run_untagged, online=online, paused=paused, concurrency=concurrency,
+                          running_jobs=running_jobs, runner_type=runner_type, project_ids=frozenset(project_ids))
+
+
+def tag_sets(*sets):
+    return frozenset(frozenset(tags) for tags in sets)
+
+
+def test_eligibility_by_tags_untagged_and_project_pool():
+    capacity = RunnerCapacityModel([
+        runner(1, tags={"fuzz", "x86"}),
+        runner(2, run_untagged=True),
+        runner(3, tags={"fuzz", "x86"}, runner_type="project_type", project_ids={10}),
+        runner(4, tags={"fuzz", "arm"}, paused=True),
+    ])
+
+    assert capacity.has_free_runner(frozenset({"fuzz", "x86"}), project_id=20)
+    assert not capacity.has_free_runner(frozenset({"fuzz", "gpu"}))
+    # Задаче без тегов нужен раннер с run_untagged
+    assert capacity.has_free_runner(frozenset(), project_id=20)
+    # Приостановленный раннер не дает свободных слотов
+    assert not capacity.has_free_runner(frozenset({"arm"}))
+
+    # Раннер проекта доступен только своему проекту
+    assert capacity.reserve(frozenset({"x86"}), project_id=20).id == 1
+    assert not capacity.has_free_runner(frozenset({"x86"}), project_id=20)
+    assert capacity.reserve(frozenset({"x86"}), project_id=10).id == 3
+
+
+def test_reserve_respects_concurrency():
+    capacity = RunnerCapacityModel([runner(1, tags={"fuzz"}, concurrency=3, running_jobs=1)])
+
+    assert capacity.total_free_slots() == 2
+    assert capacity.reserve(frozenset({"fuzz"})) is not None
+    assert capacity.reserve(frozenset({"fuzz"})) is not None
+    assert capacity.reserve(frozenset({"fuzz"})) is None
+    assert capacity.total_free_slots() == 0
+
+
+def test_reserve_all_takes_a_slot_per_fuzz_job():
+    capacity = RunnerCapacityModel([runner(1, tags={"fuzz-x86"}), runner(2, tags={"fuzz-arm"})])
+
+    reserved = capacity.reserve_all(tag_sets({"fuzz-x86"}, {"fuzz-arm"}), project_id=1)
+
+    assert sorted(r.id for r in reserved) == [1, 2]
+    assert capacity.total_free_slots() == 0
+
+
+def test_reserve_all_rolls_back_partial_reservations():
+    capacity = RunnerCapacityModel([runner(1, tags={"fuzz-x86"}, concurrency=2), runner(2, tags={"fuzz-arm"})])
+    capacity.reserve(frozenset({"fuzz-arm"}))
+
+    assert not capacity.can_reserve_all(tag_sets({"fuzz-x86"}, {"fuzz-arm"}))
+    assert capacity.reserve_all(tag_sets({"fuzz-x86"}, {"fuzz-arm"})) is None
+    # Слот x86 не остался занятым после неудачного резервирования
+    assert capacity.free_slots_by_runner() == {1: 2, 2: 0}
+    assert capacity.reserve_all(tag_sets({"fuzz-x86"})) is not None
+
+
+def test_reserve_all_prefers_scarce_tag_sets():
+    # Раннер 1 подходит обеим задачам, раннер 2 — только общей; задача "special" должна получить раннер 1
+    capacity = RunnerCapacityModel([runner(1, tags={"fuzz", "special"}), runner(2, tags={"fuzz"})])
+
+    reserved = capacity.reserve_all(tag_sets({"fuzz"}, {"fuzz", "special"}))
+
+    assert sorted(r.id for r in reserved) == [1, 2]
+
+
+def test_can_reserve_all_does_not_change_the_model():
+    capacity = RunnerCapacityModel([runner(1, run_untagged=True)])
+
+    assert capacity.can_reserve_all(None)
+    assert capacity.total_free_slots() == 1
+
+
+def test_release_restores_free_mask():
+    capacity = RunnerCapacityModel([runner(1, tags={"fuzz"})])
+    reserved = capacity.reserve_all(tag_sets({"fuzz"}))
+    assert not capacity.has_free_runner(frozenset({"fuzz"}))
+
+    capacity.release(reserved)
+
+    assert capacity.has_free_runner(frozenset({"fuzz"}))
+
+
+def test_fuzz_job_tags_per_job_with_extends_and_default():
+    ci_config = yaml.load("""
+default:
+  tags: [docker]
+.fuzz-template:
+  stage: fuzz
+  tags: [fuzz, $RUNNER_ARCH]
+fuzz-x86:
+  extends: .fuzz-template
+  tags: [fuzz, x86]
+fuzz-arm:
+  extends: [.fuzz-template]
+  tags: [fuzz, arm]
+libfuzzer:
+  stage: fuzz
+build:
+  stage: build
+  tags: [build]
+  script: !reference [.setup, script]
+""", Loader=_CiConfigLoader)
+
+    assert fuzz_job_tags(ci_config) == tag_sets({"fuzz", "x86"}, {"fuzz", "arm"}, {"docker"})
+
+
+def test_fuzz_job_tags_without_fuzz_jobs_is_unknown():
+    assert fuzz_job_tags({'build': {'stage': "build", 'tags': ["build"]}}) is None
+    # Задача фаззинга без тегов — отдельное требование run_untagged, а не отсутствие требований
+    assert fuzz_job_tags({'fuzz': {'script': ["run"]}}) == tag_sets(set())
+
+
+def test_run_pipelines_does_not_over_dispatch(scheduler):
+    capacity = RunnerCapacityModel([runner(1, tags={"fuzz-x86"}), runner(2, tags={"fuzz-arm"}, concurrency=2)])
+    projects = [SimpleNamespace(id=i, path_with_namespace=f"fuzz/p{i}") for i in (1, 2, 3)]
+    scheduler.job_tags = SimpleNamespace(job_tag_sets=lambda p: {
+        1: tag_sets({"fuzz-x86"}, {"fuzz-arm"}),
+        2: tag_sets({"fuzz-x86"}, {"fuzz-arm"}),
+        3: tag_sets({"fuzz-arm"}),
+    }[p.id])
+    created = []
+    scheduler.gl = SimpleNamespace(projects=SimpleNamespace(get=lambda project_id, lazy=False: SimpleNamespace(
+        pipelines=SimpleNamespace(create=lambda data: created.append(project_id) or SimpleNamespace(id=100)))))
+
+    started = scheduler.run_pipelines(projects, capacity)
+
+    # Второму проекту не хватает раннера x86, его слот arm остается третьему проекту
+    assert [p.id for p in started] == [1, 3]
+    assert created == [1, 3]
@@ -0,0 +1,52 @@
+from main import PipelineSummaryTracker
+from project_store import CachedProjectEnricher, ProjectStore
+from webhooks import WebhookProjectState
+
+LISTING = {'name': "p", 'path_with_namespace': "fuzz/p", 'web_url': "https://gitlab.example.com/fuzz/p",
+           'default_branch': "main", 'archived': False}
+
+
+def pipeline_event(pipeline_id, status="running", finished_at=None):
+    return {
+        'object_kind': "pipeline",
+        'project': {'id': 1},
+        'object_attributes': {'id': pipeline_id, 'ref': "main", 'tag': False, 'status': status,
+                              'created_at': "2024-05-06 12:00:00 UTC", 'finished_at': finished_at},
+    }
+
+
+def make_state(scheduler, tmp_path):
+    store = ProjectStore(str(tmp_path / "cache.sqlite3"))
+    store.put_fact(1, 'project', LISTING)
+    store.put_fact(1, 'main_branch', {'exists': True, 'commit_sha': "abc", 'last_modified': None})
+    return WebhookProjectState(scheduler, CachedProjectEnricher(scheduler, store)), store
+
+
+def test_pipeline_event_does_not_create_counter(scheduler, tmp_path):
+    state, store = make_state(scheduler, tmp_path)
+
+    state.apply_event(pipeline_event(500))
+
+    tracker = scheduler.pipeline_summary
+    assert tracker.known(1) is None
+    assert store.get_fact(1, PipelineSummaryTracker.STORE_FACT) is None
+    # Число запусков определит следующий сбор через поиск страниц
+    assert tracker.needs_seed(1, [(i, None) for i in range(tracker.page_size)], None)
+    [project] = state.get_fuzzing_projects()
+    assert project.last_pipeline_run.isoformat() == "2024-05-06T12:00:00+00:00"
+    assert project.pipeline_run_count == 0
+
+
+def test_pipeline_events_advance_known_counter(scheduler, tmp_path):
+    state, store = make_state(scheduler, tmp_path)
+    scheduler.pipeline_summary.update(1, [(499, None)], 20000)
+
+    state.apply_event(pipeline_event(500))
+    state.apply_event(pipeline_event(500, "success", "2024-05-06 13:00:00 UTC"))
+    state.apply_event(pipeline_event(498, "success", "2024-05-06 14:00:00 UTC"))
+
+    assert scheduler.pipeline_summary.known(1) == (20001, 500)
+    [project] = state.get_fuzzing_projects()
+    # Завершение более старого пайплайна не сдвигает время последнего запуска
+    assert project.last_pipeline_run.isoformat() == "2024-05-06T13:00:00+00:00"
+    assert project.pipeline_run_count == 20001
@@ -0,0 +1,259 @@
+import hmac
+import json
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread, Timer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from main import FuzzingPipelineScheduler, ProjectInfo
+from project_store import CachedProjectEnricher, dump_datetime, load_datetime
+
+ZERO_SHA = "0" * 40
+FINISHED_PIPELINE_STATUSES = {'success', 'failed', 'canceled'}
+
+
+def parse_webhook_datetime(value: Optional[str]) -> Optional[datetime]:
+    """
+    Разбор даты из события GitLab. В разных событиях встречаются форматы
+    "2024-01-01T12:00:00+03:00", "2024-01-01T12:00:00.000Z" и "2024-01-01 12:00:00 UTC"
+    """
+    if not value:
+        return None
+    if value.endswith(" UTC"):
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S UTC").replace(tzinfo=timezone.utc)
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class EventDebouncer:
+    """
+    Объединение событий по ключу: в течение delay секунд после первого события
+    сохраняется только последнее событие с тем же ключом, затем все накопленные события применяются.
+    """
+
+    def __init__(self, apply: Callable[[Dict], None], delay: float = 2.0):
+        self.apply = apply
+        self.delay = delay
+        self._pending: Dict[Tuple, Dict] = {}
+        self._lock = Lock()
+        self._timer: Optional[Timer] = None
+
+    def add(self, key: Tuple, event: Dict) -> None:
+        with self._lock:
+            self._pending[key] = event
+            if self._timer is None:
+                self._timer = Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        for event in pending.values():
+            try:
+                self.apply(event)
+            except Exception as e:
+                print(f"[WARN] Не удалось обработать событие GitLab {event.get('object_kind')}: {e}")
+
+
+class WebhookProjectState:
+    """
+    Состояние проектов, обновляемое событиями вебхуков группы GitLab (push, pipeline, project).
+    Изменения записываются в ProjectStore и в память; может использоваться как discovery_backend,
+    чтобы prioritize_projects работал по свежим данным без запросов к GitLab.
+    """
+
+    def __init__(self, scheduler: FuzzingPipelineScheduler, enricher: CachedProjectEnricher, reconciler=None):
+        """
+        :param enricher: Кэш фактов о проектах, в который записываются изменения
+        :param reconciler: Источник полного списка проектов для сверки (по умолчанию scheduler.get_fuzzing_projects)
+        """
+        self.scheduler = scheduler
+        self.enricher = enricher
+        self.store = enricher.store
+        self.reconciler = reconciler
+        self.projects: Dict[int, ProjectInfo] = {}
+        self._lock = Lock()
+        for project_id in self.store.project_ids():
+            project = enricher.load(project_id)
+            if project is not None:
+                self.projects[project_id] = project
+
+    def get_fuzzing_projects(self) -> List[ProjectInfo]:
+        with self._lock:
+            return [self.projects[project_id] for project_id in sorted(self.projects)]
+
+    def reconcile(self) -> None:
+        """Сверка с GitLab: восполняет события, пропущенные во время простоя приемника"""
+        if self.reconciler is not None:
+            projects = self.reconciler.get_fuzzing_projects()
+        else:
+            # Без reconciler состояние собирается обычным путем, без подмены на самого себя
+            backend, self.scheduler.discovery_backend = self.scheduler.discovery_backend, None
+            try:
+                projects = self.scheduler.get_fuzzing_projects()
+            finally:
+                self.scheduler.discovery_backend = backend
+        with self._lock:
+            self.projects = {p.id: p for p in projects}
+
+    def event_key(self, event: Dict) -> Optional[Tuple]:
+        """Ключ для объединения событий; None — событие не влияет на состояние"""
+        kind = event.get('object_kind') or event.get('event_name')
+        if kind == 'push':
+            return event['project_id'], 'push', event.get('ref')
+        if kind == 'pipeline':
+            return event['project']['id'], 'pipeline', event['object_attributes']['id']
+        if kind and kind.startswith('project_'):
+            return event['project_id'], 'project'
+        return None
+
+    def apply_event(self, event: Dict) -> None:
+        kind = event.get('object_kind') or event.get('event_name')
+        if kind == 'push':
+            project_id = self._apply_push(event)
+        elif kind == 'pipeline':
+            project_id = self._apply_pipeline(event)
+        else:
+            project_id = self._apply_project_event(event)
+
+        if project_id is None:
+            return
+        project = self.enricher.load(project_id)
+        with self._lock:
+            if project is None:
+                self.projects.pop(project_id, None)
+            else:
+                self.projects[project_id] = project
+
+        # Завершенный пайплайн фаззинга импортирует результаты в DefectDojo
+        finished = kind == 'pipeline' and event['object_attributes'].get('status') in FINISHED_PIPELINE_STATUSES
+        if finished and project is not None:
+            self.scheduler.invalidate_defect_count(project)
+
+    def _apply_push(self, event: Dict) -> Optional[int]:
+        if event.get('ref') != "refs/heads/main":
+            return None
+        project_id = event['project_id']
+
+        if event.get('after') == ZERO_SHA:
+            self.store.put_fact(project_id, 'main_branch', None)
+            return project_id
+
+        commits = event.get('commits') or []
+        last_modified = parse_webhook_datetime(commits[-1]['timestamp']) if commits else None
+        head_sha = event.get('after')
+        self.store.put_fact(project_id, 'main_branch', {
+            'exists': True,
+            'commit_sha': head_sha,
+            'last_modified': dump_datetime(last_modified),
+        })
+
+        # В событии не больше 20 коммитов: если их было больше, наличие .gitlab-ci.yml перепроверяется
+        # при следующем обращении, так как SHA головного коммита уже не совпадет
+        if event.get('total_commits_count', len(commits)) > len(commits):
+            return project_id
+
+        ci_file = self.store.get_fact(project_id, 'ci_file')
+        exists = bool(ci_file and ci_file.value and ci_file.value['exists'])
+        blob_id = ci_file.value.get('blob_id') if ci_file and ci_file.value else None
+        touched = False
+        for commit in commits:
+            if ".gitlab-ci.yml" in commit.get('added', []) + commit.get('modified', []):
+                exists, touched = True, True
+            elif ".gitlab-ci.yml" in commit.get('removed', []):
+                exists, touched = False, True
+        if ci_file is not None or touched:
+            # Если файл менялся, его blob неизвестен и будет получен при следующей проверке
+            self.store.put_fact(project_id, 'ci_file', {
+                'exists': exists,
+                'commit_sha': head_sha,
+                'blob_id': None if touched else blob_id,
+            })
+        return project_id
+
+    def _apply_pipeline(self, event: Dict) -> Optional[int]:
+        attributes = event['object_attributes']
+        if attributes.get('ref') != "main" or attributes.get('tag'):
+            return None
+        project_id = event['project']['id']
+
+        tracker = self.scheduler.pipeline_summary
+        known = tracker.known(project_id)
+        updated_at = parse_webhook_datetime(attributes.get('finished_at') or attributes.get('created_at'))
+        # Неизвестный счетчик не создается: без X-Total (больше 10k пайплайнов) он определяется поиском
+        # страниц при следующем сборе, а счетчик из одного события этот поиск бы отключил
+        if known is not None:
+            tracker.update(project_id, [(attributes['id'], None)], None)
+
+        last_pipeline_run = updated_at
+        cached = self.store.get_fact(project_id, 'pipelines')
+        if known is not None and known[1] > attributes['id'] and cached is not None and cached.value:
+            # Событие о более старом пайплайне не меняет время последнего запуска
+            last_pipeline_run = load_datetime(cached.value['last_pipeline_run'])
+        # Число запусков сохраняет трекер, в факте только время последнего запуска
+        self.store.put_fact(project_id, 'pipelines', {'last_pipeline_run': dump_datetime(last_pipeline_run)})
+        return project_id
+
+    def _apply_project_event(self, event: Dict) -> Optional[int]:
+        project_id = event.get('project_id')
+        if project_id is None:
+            return None
+        if event.get('event_name') == 'project_destroy':
+            self.store.delete_project(project_id)
+        else:
+            # Переименование, перенос или изменение настроек: метаданные перечитываются в следующем цикле
+            self.store.invalidate(project_id, 'project')
+        return project_id
+
+
+class WebhookReceiver:
+    """HTTP приемник вебхуков группы GitLab с проверкой секретного токена (X-Gitlab-Token)"""
+
+    def __init__(self, state: WebhookProjectState, secret_token: str,
+                 host: str = "0.0.0.0", port: int = 8080, debounce: float = 2.0):
+        self.state = state
+        self.secret_token = secret_token
+        self.debouncer = EventDebouncer(state.apply_event, debounce)
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[Thread] = None
+
+    def _make_handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                token = self.headers.get('X-Gitlab-Token', '')
+                if not hmac.compare_digest(token.encode(), receiver.secret_token.encode()):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    event = json.loads(self.rfile.read(length))
+                    key = receiver.state.event_key(event)
+                except (ValueError, KeyError, TypeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+
+                if key is not None:
+                    receiver.debouncer.add(key, event)
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> None:
+        self._thread = Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.debouncer.flush()